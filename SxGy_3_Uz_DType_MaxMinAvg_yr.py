@@ -55,47 +55,306 @@ it to your python program.
 
 """
 
-
-# func csv to array
-def read_data(file_path):
-    with open(file_path, "r") as f:
-        # Read the file content
-        raw_data = f.read()
-
-    # Split the data by lines
-    lines = raw_data.splitlines()
-
-    # Split each line by commas to form a 2D array
-    array = [line.split(",") for line in lines]
-
-    # Exclude the header
-    data = array[1:]
-
-    # Convert year to int and kwh_per_acc to float while appending the tuples to the final list
-    processed_data = [(row[0], int(row[1]), float(row[5])) for row in data]
-
-    return processed_data
-
-
-# func to filter data by dwelling type then calculate statistics by year
-def calculate_stats(data, dwelling_type):
-    filtered_data = [row for row in data if row[0] == dwelling_type]
-    if not filtered_data:
+from array import array
+import argparse
+import codecs
+import csv
+import hashlib
+import json
+import math
+import os
+import struct
+import numpy as np
+
+
+# the csv is read in blocks of this many bytes (cut back to whole lines), so
+# memory use does not grow with the file
+BLOCK_SIZE = 1 << 20
+
+# number of malformed lines listed by line number (the rest are only counted)
+MAX_REPORTED_ROWS = 10
+
+# aggregates of one (dwelling type, year, month, region) group; text columns are
+# integer codes into the lists of names
+GROUP_DTYPE = np.dtype(
+    [
+        ("dwelling_type", "<i2"),
+        ("year", "<i2"),
+        ("month", "<i2"),
+        ("Region", "<i2"),
+        ("maximum", "<f8"),
+        ("minimum", "<f8"),
+        ("total", "<f8"),
+        ("count", "<i8"),
+    ]
+)
+GROUP_KEY = ("dwelling_type", "year", "month", "Region")
+
+# sidecar index next to the csv, storing its group aggregates:
+#   magic (8s) | version (H) | csv size (Q) | csv mtime in ns (q) | csv sha256 (32s)
+#   | group count (Q) | json length (I), then the json of the names and malformed
+#   rows, then the groups as GROUP_DTYPE records
+INDEX_SUFFIX = ".idx"
+INDEX_MAGIC = b"KWHINDEX"
+# Bumped when the layout or the aggregates change, so old indexes are rebuilt
+INDEX_VERSION = 2
+INDEX_HEADER_FORMAT = "<8sHQq32sQI"
+
+
+# func to decode one line of the csv; None if it is not valid UTF-8
+def decode_line(line):
+    try:
+        return line.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+
+# func to decode a run of whole lines; the block is decoded in one go, and line
+# by line only if that fails, so one bad byte costs only its own line
+def decode_lines(block):
+    try:
+        return block.decode("utf-8").split("\n")[:-1]
+    except UnicodeDecodeError:
+        return [decode_line(line) for line in block.split(b"\n")[:-1]]
+
+
+# func to read a file in fixed-size blocks of whole lines, without the byte order
+# mark; yields (line number of the first line, lines), with None for the lines
+# that are not valid UTF-8. The raw bytes are fed to digest (a hashlib object)
+# if given
+def read_lines(file_path, block_size=BLOCK_SIZE, digest=None):
+    line_number = 1
+    rest = b""
+    with open(file_path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            if digest is not None:
+                digest.update(block)
+            if line_number == 1 and not rest:
+                block = block.removeprefix(codecs.BOM_UTF8)
+            # keep the unfinished last line for the next block
+            block = rest + block
+            cut = block.rfind(b"\n") + 1
+            rest = block[cut:]
+            lines = decode_lines(block[:cut])
+            yield line_number, lines
+            line_number += len(lines)
+    if rest:
+        yield line_number, [decode_line(rest)]
+
+
+# func to record a malformed line: counted, and listed if among the first ones
+def add_malformed(malformed, number, reason):
+    malformed["count"] += 1
+    if len(malformed["rows"]) < MAX_REPORTED_ROWS:
+        malformed["rows"].append((number, reason))
+
+
+# func to parse a block of csv lines to columnar arrays: text columns become
+# integer codes into the lists of names and year and month int16. kwh_per_acc
+# stays float64, as float32 shifts some averages in the second decimal. Rows
+# that do not parse, and lines that could not be decoded (None), are recorded
+# in malformed instead
+def parse_block(lines, line_number, names, malformed):
+    dwelling_types, regions, locations = array("h"), array("h"), array("h")
+    years, months, kwh = array("h"), array("h"), array("d")
+
+    for number, line in enumerate(lines, line_number):
+        if line is None:
+            add_malformed(malformed, number, "not valid UTF-8")
+            continue
+        line = line.rstrip("\r")
+        if not line:
+            continue
+        try:
+            # each line is parsed on its own, so a stray quote cannot run on
+            # into the lines after it; only lines with quotes need the csv module
+            row = next(csv.reader((line,))) if '"' in line else line.split(",")
+            if len(row) != 6 or not row[0]:
+                raise ValueError(f"expected 6 fields, got {len(row)}")
+            year, month, kwh_per_acc = int(row[1]), int(row[2]), float(row[5])
+            if not (0 < year < 10000 and 1 <= month <= 12):
+                raise ValueError(f"year {year} or month {month} out of range")
+            if not math.isfinite(kwh_per_acc):
+                raise ValueError(f"kwh_per_acc is {row[5]}")
+        except (ValueError, csv.Error) as error:
+            add_malformed(malformed, number, str(error))
+            continue
+        dwelling_types.append(names["dwelling_type"].setdefault(row[0], len(names["dwelling_type"])))
+        years.append(year)
+        months.append(month)
+        regions.append(names["Region"].setdefault(row[3], len(names["Region"])))
+        locations.append(names["Location"].setdefault(row[4], len(names["Location"])))
+        kwh.append(kwh_per_acc)
+
+    return {
+        "dwelling_type": np.frombuffer(dwelling_types, dtype=np.int16),
+        "year": np.frombuffer(years, dtype=np.int16),
+        "month": np.frombuffer(months, dtype=np.int16),
+        "Region": np.frombuffer(regions, dtype=np.int16),
+        "Location": np.frombuffer(locations, dtype=np.int16),
+        "kwh_per_acc": np.frombuffer(kwh, dtype=np.float64),
+    }
+
+
+# func to combine the groups sharing the same values of the key fields into
+# one, in one vectorized pass; fields outside the key are taken from any of
+# the combined groups
+def combine(groups, key=GROUP_KEY):
+    packed = np.zeros(len(groups), dtype=np.int64)
+    for field in key:
+        packed = packed << 16 | groups[field].astype(np.uint16)
+    unique, inverse = np.unique(packed, return_inverse=True)
+
+    combined = np.zeros(len(unique), dtype=GROUP_DTYPE)
+    representative = np.zeros(len(unique), dtype=np.intp)
+    representative[inverse] = np.arange(len(groups))
+    for field in GROUP_KEY:
+        combined[field] = groups[field][representative]
+    combined["maximum"] = -np.inf
+    combined["minimum"] = np.inf
+    np.maximum.at(combined["maximum"], inverse, groups["maximum"])
+    np.minimum.at(combined["minimum"], inverse, groups["minimum"])
+    np.add.at(combined["total"], inverse, groups["total"])
+    np.add.at(combined["count"], inverse, groups["count"])
+    return combined
+
+
+# func to group the rows of a block by (dwelling type, year, month, region)
+def aggregate(data):
+    groups = np.zeros(len(data["year"]), dtype=GROUP_DTYPE)
+    for field in GROUP_KEY:
+        groups[field] = data[field]
+    for field in ("maximum", "minimum", "total"):
+        groups[field] = data["kwh_per_acc"]
+    groups["count"] = 1
+    return combine(groups)
+
+
+# func to read the csv block by block, folding every block into the running
+# groups; returns (groups, names, malformed) where names maps each text column
+# to its list of names and malformed holds the number of skipped rows and the
+# first few (line number, reason)
+def read_data(file_path, block_size=BLOCK_SIZE, digest=None):
+    codes = {"dwelling_type": {}, "Region": {}, "Location": {}}
+    malformed = {"count": 0, "rows": []}
+    groups = np.zeros(0, dtype=GROUP_DTYPE)
+    for line_number, lines in read_lines(file_path, block_size, digest):
+        if line_number == 1:
+            lines = lines[1:]  # Exclude the header
+            line_number = 2
+        block = parse_block(lines, line_number, codes, malformed)
+        groups = combine(np.concatenate([groups, aggregate(block)]))
+    names = {column: list(column_codes) for column, column_codes in codes.items()}
+    return groups, names, malformed
+
+
+# func to roll the groups up to the statistics of each dwelling type by year;
+# returns {dwelling_type: {year: (maximum, minimum, total, count)}}
+def summarize(groups, names):
+    stats = {dwelling_type: {} for dwelling_type in names["dwelling_type"]}
+    for group in combine(groups, ("dwelling_type", "year")).tolist():
+        dwelling_type, year, _, _, maximum, minimum, total, count = group
+        stats[names["dwelling_type"][dwelling_type]][year] = (maximum, minimum, total, count)
+    return stats
+
+
+# func to hash a whole file with sha256
+def file_digest(file_path, block_size=BLOCK_SIZE):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.digest()
+
+
+# func to write the sidecar index of a csv; the file is replaced atomically so a
+# concurrent run never reads a half-written index
+def save_index(path, size, mtime_ns, digest, groups, names, malformed):
+    meta = json.dumps({"names": names, "malformed": malformed}).encode("utf-8")
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(
+            struct.pack(
+                INDEX_HEADER_FORMAT, INDEX_MAGIC, INDEX_VERSION, size, mtime_ns, digest, len(groups), len(meta)
+            )
+        )
+        f.write(meta)
+        f.write(np.ascontiguousarray(groups, dtype=GROUP_DTYPE).tobytes())
+    os.replace(tmp_path, path)
+
+
+# func to read the sidecar index of a csv if it still describes the csv; returns
+# (groups, names, malformed), or None if it is missing, stale or unreadable. A
+# matching size and mtime is trusted; if only the mtime changed (the file was
+# touched or copied) the contents are hashed and a match refreshes the index
+def load_index(file_path):
+    path = file_path + INDEX_SUFFIX
+    stat = os.stat(file_path)
+    try:
+        with open(path, "rb") as f:
+            header = f.read(struct.calcsize(INDEX_HEADER_FORMAT))
+            magic, version, size, mtime_ns, digest, group_count, meta_length = struct.unpack(
+                INDEX_HEADER_FORMAT, header
+            )
+            if magic != INDEX_MAGIC or version != INDEX_VERSION or size != stat.st_size:
+                return None
+            if mtime_ns != stat.st_mtime_ns and digest != file_digest(file_path):
+                return None
+            meta = json.loads(f.read(meta_length))
+            groups = np.frombuffer(f.read(group_count * GROUP_DTYPE.itemsize), dtype=GROUP_DTYPE)
+    except (OSError, ValueError, struct.error):
+        return None
+    if len(groups) != group_count:
+        return None
+
+    malformed = {"count": meta["malformed"]["count"], "rows": [tuple(row) for row in meta["malformed"]["rows"]]}
+    if mtime_ns != stat.st_mtime_ns:
+        try:
+            save_index(path, stat.st_size, stat.st_mtime_ns, digest, groups, meta["names"], malformed)
+        except OSError:
+            pass
+    return groups, meta["names"], malformed
+
+
+# func to get the statistics of a csv, from its sidecar index when that is up to
+# date, otherwise by reading the csv and writing a new index; returns (stats,
+# malformed)
+def load_stats(file_path, use_index=True):
+    cached = load_index(file_path) if use_index else None
+    if cached is None:
+        before = os.stat(file_path)
+        digest = hashlib.sha256()
+        cached = read_data(file_path, digest=digest)
+        after = os.stat(file_path)
+        # skip the index if the csv changed while it was read
+        unchanged = (before.st_size, before.st_mtime_ns) == (after.st_size, after.st_mtime_ns)
+        if use_index and unchanged:
+            try:
+                save_index(
+                    file_path + INDEX_SUFFIX, after.st_size, after.st_mtime_ns, digest.digest(), *cached
+                )
+            except OSError as error:
+                print(f"Could not write the index for {file_path}: {error}")
+    groups, names, malformed = cached
+    return summarize(groups, names), malformed
+
+
+# func to look up the average consumption of a dwelling type in a year
+def average(stats, dwelling_type, year):
+    _, _, total, count = stats[dwelling_type][year]
+    return total / count
+
+
+# func to tabulate the statistics of a dwelling type by year
+def calculate_stats(stats, dwelling_type):
+    consumption_by_year = stats.get(dwelling_type)
+    if not consumption_by_year:
         print(f"No data available for dwelling type: {dwelling_type}")
         return
 
-    # dict to store consumption data by year
-    consumption_by_year = {}
-
-    for row in filtered_data:
-        year = row[1]
-        kwh_per_acc = row[2]
-
-        if year not in consumption_by_year:
-            consumption_by_year[year] = []
-
-        consumption_by_year[year].append(kwh_per_acc)
-
     print("________________________________________")
     print(f" {dwelling_type} consumption summary")
     print("________________________________________")
@@ -103,10 +362,8 @@ def calculate_stats(data, dwelling_type):
     print("________________________________________")
 
     for year in sorted(consumption_by_year.keys(), reverse=True):
-        consumption = consumption_by_year[year]
-        max_consumption = max(consumption)
-        min_consumption = min(consumption)
-        avg_consumption = sum(consumption) / len(consumption)
+        max_consumption, min_consumption, _, _ = consumption_by_year[year]
+        avg_consumption = average(stats, dwelling_type, year)
 
         print(
             f"|{year}    |{max_consumption:>10.2f}|{min_consumption:>10.2f}|{avg_consumption:>10.2f}|"
@@ -116,23 +373,18 @@ def calculate_stats(data, dwelling_type):
 
 
 # func to provide the insight
-def provide_insights(data, dwelling_type):
-    filtered_data = [row for row in data if row[0] == dwelling_type]
-    if not filtered_data:
+def provide_insights(stats, dwelling_type):
+    if not stats.get(dwelling_type):
         return
 
     # years
-    years = list(set(row[1] for row in filtered_data))
+    years = stats[dwelling_type].keys()
 
     recent_year = max(years)
     oldest_year = min(years)
 
-    recent_avg = sum(row[2] for row in filtered_data if row[1] == recent_year) / len(
-        [row for row in filtered_data if row[1] == recent_year]
-    )
-    oldest_avg = sum(row[2] for row in filtered_data if row[1] == oldest_year) / len(
-        [row for row in filtered_data if row[1] == oldest_year]
-    )
+    recent_avg = average(stats, dwelling_type, recent_year)
+    oldest_avg = average(stats, dwelling_type, oldest_year)
 
     print("\nSummary of Insights:")
     if recent_avg > oldest_avg:
@@ -150,25 +402,20 @@ def provide_insights(data, dwelling_type):
 
 
 # func add % change
-def percentage_change_analysis(data, dwelling_type):
-    filtered_data = [row for row in data if row[0] == dwelling_type]
-    if not filtered_data:
+def percentage_change_analysis(stats, dwelling_type):
+    if not stats.get(dwelling_type):
         return
 
     print("\nAdditional Analysis: Percentage Change in Consumption Over Time")
 
-    years = sorted(set(row[1] for row in filtered_data), reverse=True)
+    years = sorted(stats[dwelling_type].keys(), reverse=True)
 
     for i in range(1, len(years)):
         current_year = years[i - 1]
         previous_year = years[i]
 
-        current_year_avg = sum(
-            row[2] for row in filtered_data if row[1] == current_year
-        ) / len([row for row in filtered_data if row[1] == current_year])
-        previous_year_avg = sum(
-            row[2] for row in filtered_data if row[1] == previous_year
-        ) / len([row for row in filtered_data if row[1] == previous_year])
+        current_year_avg = average(stats, dwelling_type, current_year)
+        previous_year_avg = average(stats, dwelling_type, previous_year)
 
         percentage_change = (
             (current_year_avg - previous_year_avg) / previous_year_avg
@@ -179,48 +426,80 @@ def percentage_change_analysis(data, dwelling_type):
         )
 
 
-# read and push to create array
-data = read_data("AvgHouseHoldElectricity.csv")
-
-# extract unique dwelling types from the csv
-dwelling_types = sorted(set(row[0] for row in data))
-
-# main process loop
-while True:
-    print("\nSelect the dwelling type for analysis:")
-    for index, value in enumerate(dwelling_types, 1):
-        print(f"{index}: {value}")
-
-    # input with handling
-    user_choice = input(
-        "Enter the number corresponding to the dwelling type or type the name exactly: "
-    ).strip()
-
-    # check for digit entered or actually dwelling type name
-    if user_choice.isdigit() and 1 <= int(user_choice) <= len(dwelling_types):
-        dwelling_type = dwelling_types[int(user_choice) - 1]
-    elif user_choice in dwelling_types:
-        dwelling_type = user_choice
-    else:
-        print(
-            f"\nInvalid choice '{user_choice}'. Please enter a valid number or the dwelling type name."
+# func to print the reports for every dwelling type, without prompting
+def batch(stats):
+    for dwelling_type in sorted(stats):
+        calculate_stats(stats, dwelling_type)
+        provide_insights(stats, dwelling_type)
+        percentage_change_analysis(stats, dwelling_type)
+        print()
+
+
+# func for the interactive loop, prompting for the dwelling types to analyse
+def interactive(stats):
+    # extract unique dwelling types from the csv
+    dwelling_types = sorted(stats)
+
+    # main process loop
+    while True:
+        print("\nSelect the dwelling type for analysis:")
+        for index, value in enumerate(dwelling_types, 1):
+            print(f"{index}: {value}")
+
+        # input with handling
+        user_choice = input(
+            "Enter the number corresponding to the dwelling type or type the name exactly: "
+        ).strip()
+
+        # check for digit entered or actually dwelling type name
+        if user_choice.isdigit() and 1 <= int(user_choice) <= len(dwelling_types):
+            dwelling_type = dwelling_types[int(user_choice) - 1]
+        elif user_choice in dwelling_types:
+            dwelling_type = user_choice
+        else:
+            print(
+                f"\nInvalid choice '{user_choice}'. Please enter a valid number or the dwelling type name."
+            )
+            continue  # else failed case then reprompt
+
+        # tabulate consumption data
+        calculate_stats(stats, dwelling_type)
+
+        # insights based on the results
+        provide_insights(stats, dwelling_type)
+
+        # additional analysis (percentage change over the years)
+        percentage_change_analysis(stats, dwelling_type)
+
+        # retry another type
+        cont = (
+            input("\nDo you want to analyze another dwelling type? (yes/no): ")
+            .strip()
+            .lower()
         )
-        continue  # else failed case then reprompt
+        if cont != "yes":
+            break
 
-    # tabulate consumption data
-    calculate_stats(data, dwelling_type)
 
-    # insights based on the results
-    provide_insights(data, dwelling_type)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dwelling type electricity consumption analysis")
+    parser.add_argument("csv", nargs="?", default="AvgHouseHoldElectricity.csv", help="consumption csv")
+    parser.add_argument(
+        "--batch", action="store_true", help="print the reports for all dwelling types and exit"
+    )
+    parser.add_argument(
+        "--no-index", action="store_true", help="always read the csv, without the sidecar index"
+    )
+    args = parser.parse_args()
 
-    # additional analysis (percentage change over the years)
-    percentage_change_analysis(data, dwelling_type)
+    # read the csv (or its index) into the statistics
+    stats, malformed = load_stats(args.csv, use_index=not args.no_index)
+    if malformed["count"]:
+        print(f"Skipped {malformed['count']} malformed rows:")
+        for line_number, reason in malformed["rows"]:
+            print(f"- line {line_number}: {reason}")
 
-    # retry another type
-    cont = (
-        input("\nDo you want to analyze another dwelling type? (yes/no): ")
-        .strip()
-        .lower()
-    )
-    if cont != "yes":
-        break
+    if args.batch:
+        batch(stats)
+    else:
+        interactive(stats)
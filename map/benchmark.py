@@ -0,0 +1,458 @@
+import argparse
+import ast
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import numpy as np
+from worldgen import (
+    NO_WALL,
+    generate_perlin_noise_map,
+    generate_regions,
+    generate_walls,
+    generate_world,
+)
+from caves import random_fill, run_automaton
+from connectivity import connect_caves, connect_maze
+from collision import collides_batch, move_collides
+from pathfinding import PathFinder
+from hierarchical import HierarchicalPathFinder
+from protocol import (
+    MSG_CHUNK,
+    parse_frame,
+    encode_chunk,
+    decode_chunk,
+    encode_window_update,
+    apply_delta,
+)
+import server
+
+# The electricity analysis and the generation notebook live at the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+import SxGy_3_Uz_DType_MaxMinAvg_yr as electricity
+
+NOTEBOOK_FILE = os.path.join(ROOT, "generation.ipynb")
+
+# Benchmark suite for the hot paths: world generation, chunk serving, collision,
+# pathfinding and the electricity aggregation. Every benchmark is seeded, so a
+# run on the same machine measures the same work; results are written as JSON
+# and compared against a stored baseline to catch regressions.
+#
+# Map sizes (width = height) every benchmark runs at
+SIZES = (200, 1000, 4000)
+SEED = 42
+
+# Baseline compared against by default, and the slowdown reported as a regression
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+REGRESSION_THRESHOLD = 1.25
+
+# Work per timed call: chunk requests, collision circles, path queries. Flat
+# path queries stay within PATH_RANGE cells; hierarchical ones cross the map
+CHUNK_REQUESTS = 200
+COLLISION_CIRCLES = 10000
+PATH_QUERIES = 20
+PATH_RANGE = 128
+# Rows of the synthetic electricity csv per map cell row
+CSV_ROWS_PER_SIZE = 100
+
+# Registered benchmarks as (name, setup); setup(size) does the untimed
+# preparation and returns the function to time
+BENCHMARKS = []
+
+# Worlds and electricity csv files shared by the benchmarks of one size,
+# generated once; the files go to a scratch directory removed on exit
+worlds = {}
+csv_files = {}
+scratch = tempfile.TemporaryDirectory()
+
+
+# Decorator registering a benchmark setup under a name
+def benchmark(name):
+    def register(setup):
+        BENCHMARKS.append((name, setup))
+        return setup
+
+    return register
+
+
+# Function to get the (connected) world of a size, generating it on first use
+def world(size):
+    if size not in worlds:
+        maze, noise_map, clusters = generate_world(size, size, SEED)
+        worlds[size] = connect_maze(maze), noise_map, clusters
+    return worlds[size]
+
+
+# Function to draw seeded random open cells of a maze, as (x, y) pairs
+def open_cells(maze, count, rng):
+    cells = np.flatnonzero(np.asarray(maze).ravel() == NO_WALL)
+    picks = rng.choice(cells, size=count)
+    width = maze.shape[1]
+    return [(int(cell % width), int(cell // width)) for cell in picks]
+
+
+# Function to draw seeded pairs of open cells, optionally at most max_distance
+# apart on each axis
+def path_pairs(maze, count, rng, max_distance=None):
+    starts = open_cells(maze, count, rng)
+    if max_distance is None:
+        return list(zip(starts, open_cells(maze, count, rng)))
+    height, width = maze.shape
+    pairs = []
+    for x, y in starts:
+        while True:
+            goal_x = int(np.clip(x + rng.integers(-max_distance, max_distance + 1), 0, width - 1))
+            goal_y = int(np.clip(y + rng.integers(-max_distance, max_distance + 1), 0, height - 1))
+            if maze[goal_y, goal_x] == NO_WALL:
+                pairs.append(((x, y), (goal_x, goal_y)))
+                break
+    return pairs
+
+
+@benchmark("generate_perlin_noise_map")
+def bench_perlin(size):
+    return lambda: generate_perlin_noise_map(size, size, SEED)
+
+
+@benchmark("generate_regions")
+def bench_regions(size):
+    perlin_noise_map = generate_perlin_noise_map(size, size, SEED)
+    return lambda: generate_regions(perlin_noise_map, SEED)
+
+
+@benchmark("generate_walls")
+def bench_walls(size):
+    _, noise_map, _ = world(size)
+    return lambda: generate_walls(noise_map, SEED)
+
+
+@benchmark("connect_maze")
+def bench_connect(size):
+    maze, _, _ = generate_world(size, size, SEED)
+    return lambda: connect_maze(maze)
+
+
+# Chunk requests as the server answers them: cut the chunk around a player,
+# frame it, and decode it again as the client does
+@benchmark("get_maze_chunk_roundtrip")
+def bench_chunk(size):
+    maze, _, _ = world(size)
+    centers = open_cells(maze, CHUNK_REQUESTS, np.random.default_rng(SEED))
+    # The server clamps chunks to its configured world size
+    server.width = server.height = size
+
+    def run():
+        for center_x, center_y in centers:
+            min_x, min_y, _, _ = server.get_chunk_bounds(center_x, center_y)
+            chunk = server.get_maze_chunk(maze, center_x, center_y)
+            frame = b"".join(encode_chunk(min_x, min_y, chunk, MSG_CHUNK))
+            _, payload, _ = parse_frame(frame)
+            decode_chunk(payload)
+
+    return run
+
+
+# Streamed window updates for a player walking one cell per request
+@benchmark("window_update_roundtrip")
+def bench_window(size):
+    maze, _, _ = world(size)
+    half = 25
+    x, y = half, size // 2
+    steps = min(CHUNK_REQUESTS, size - 2 * half)
+
+    def run():
+        window = (x - half, y - half, x + half, y + half)
+        frame = b"".join(encode_window_update(maze, None, window))
+        origin_x, origin_y, cells = decode_chunk(parse_frame(frame)[1])
+        for step in range(1, steps):
+            new = (x + step - half, y - half, x + step + half, y + half)
+            frame = b"".join(encode_window_update(maze, window, new))
+            origin_x, origin_y, cells = apply_delta(origin_x, origin_y, cells, parse_frame(frame)[1])
+            window = new
+
+    return run
+
+
+@benchmark("collides_batch")
+def bench_collision(size):
+    maze, _, _ = world(size)
+    rng = np.random.default_rng(SEED)
+    xs = rng.uniform(0, size, COLLISION_CIRCLES)
+    ys = rng.uniform(0, size, COLLISION_CIRCLES)
+    return lambda: collides_batch(maze, 0, 0, xs, ys, 0.3)
+
+
+@benchmark("move_collides")
+def bench_move(size):
+    maze, _, _ = world(size)
+    rng = np.random.default_rng(SEED)
+    moves = rng.uniform(1, size - 1, (CHUNK_REQUESTS, 2))
+    steps = rng.uniform(-0.5, 0.5, (CHUNK_REQUESTS, 2))
+
+    def run():
+        for (x, y), (dx, dy) in zip(moves, steps):
+            move_collides(maze, 0, 0, x, y, x + dx, y + dy, 0.3)
+
+    return run
+
+
+@benchmark("find_path")
+def bench_path(size):
+    maze, _, _ = world(size)
+    path_finder = PathFinder(maze)
+    pairs = path_pairs(maze, PATH_QUERIES, np.random.default_rng(SEED), PATH_RANGE)
+    return lambda: [path_finder.find_path(start, goal) for start, goal in pairs]
+
+
+@benchmark("find_jump_path")
+def bench_jump_path(size):
+    maze, _, _ = world(size)
+    path_finder = PathFinder(maze)
+    path_finder.jump_tables()
+    pairs = path_pairs(maze, PATH_QUERIES, np.random.default_rng(SEED), PATH_RANGE)
+    return lambda: [path_finder.find_jump_path(start, goal) for start, goal in pairs]
+
+
+@benchmark("hierarchical_build")
+def bench_hierarchical_build(size):
+    maze, _, _ = world(size)
+    path_finder = PathFinder(maze)
+    return lambda: HierarchicalPathFinder(maze, path_finder=path_finder)
+
+
+@benchmark("hierarchical_find_path")
+def bench_hierarchical_path(size):
+    maze, _, _ = world(size)
+    planner = HierarchicalPathFinder(maze)
+    pairs = path_pairs(maze, PATH_QUERIES, np.random.default_rng(SEED))
+    return lambda: [planner.find_path(start, goal) for start, goal in pairs]
+
+
+# Function to write a seeded synthetic consumption csv in the layout of
+# AvgHouseHoldElectricity.csv
+def write_electricity_csv(path, rows):
+    rng = np.random.default_rng(SEED)
+    dwelling_types = np.array(["1-room / 2-room", "3-room", "4-room", "5-room and Executive", "Landed Properties"])
+    regions = np.array(["Central Region", "East Region", "North East Region", "North Region", "West Region"])
+    columns = [
+        dwelling_types[rng.integers(0, len(dwelling_types), rows)],
+        rng.integers(2010, 2024, rows).astype(str),
+        rng.integers(1, 13, rows).astype(str),
+        regions[rng.integers(0, len(regions), rows)],
+        np.char.add("Town ", rng.integers(0, 40, rows).astype(str)),
+        np.char.mod("%.1f", rng.uniform(50, 1500, rows)),
+    ]
+    with open(path, "w", encoding="utf-8-sig") as f:
+        f.write("dwelling_type,year,month,Region,Location,kwh_per_acc\n")
+        for row in zip(*columns):
+            f.write(",".join(row) + "\n")
+
+
+# Function to get a connected cave grid of a size (True is open), as the
+# notebook's cave passes produce
+def cave(size):
+    cells = random_fill(0, 0, size, size, SEED)
+    return connect_caves(run_automaton(cells, np.ones_like(cells)))
+
+
+# Function to load functions and classes defined in the code cells of a
+# notebook, without running the rest of the cells; returns {name: object}
+def notebook_definitions(path, names):
+    with open(path, encoding="utf-8") as f:
+        cells = json.load(f)["cells"]
+    namespace = {"np": np}
+    for cell in cells:
+        if cell["cell_type"] != "code":
+            continue
+        try:
+            tree = ast.parse("".join(cell["source"]))
+        except SyntaxError:  # cells with IPython magics
+            continue
+        imports = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+        definitions = [
+            node
+            for node in tree.body
+            if isinstance(node, (ast.FunctionDef, ast.ClassDef)) and node.name in names
+        ]
+        if not definitions:
+            continue
+        # Imports the definitions do not need may be missing (plotting)
+        for node in imports:
+            try:
+                exec(compile(ast.Module(body=[node], type_ignores=[]), path, "exec"), namespace)
+            except ImportError:
+                pass
+        exec(compile(ast.Module(body=definitions, type_ignores=[]), path, "exec"), namespace)
+    return {name: namespace[name] for name in names}
+
+
+@benchmark("cave_automaton")
+def bench_cave_automaton(size):
+    cells = random_fill(0, 0, size, size, SEED)
+    mask = np.ones_like(cells)
+    return lambda: run_automaton(cells, mask)
+
+
+# The notebook's A* over a cave grid, on (row, column) cells
+@benchmark("astar_path")
+def bench_astar_path(size):
+    astar_path = notebook_definitions(NOTEBOOK_FILE, ["PriorityQueue", "heuristic", "astar_path"])["astar_path"]
+    cells = cave(size)
+    # path_pairs draws (x, y) cells of a maze; open cave cells are NO_WALL
+    pairs = path_pairs(np.where(cells, NO_WALL, 1 + NO_WALL), PATH_QUERIES, np.random.default_rng(SEED), PATH_RANGE)
+    pairs = [((y0, x0), (y1, x1)) for (x0, y0), (x1, y1) in pairs]
+    return lambda: [astar_path(cells, start, goal) for start, goal in pairs]
+
+
+# Function to get the electricity csv of a size, writing it on first use
+def electricity_csv(size):
+    if size not in csv_files:
+        csv_files[size] = os.path.join(scratch.name, f"consumption_{size}.csv")
+        write_electricity_csv(csv_files[size], size * CSV_ROWS_PER_SIZE)
+    return csv_files[size]
+
+
+@benchmark("electricity_read")
+def bench_electricity_read(size):
+    path = electricity_csv(size)
+    return lambda: electricity.load_stats(path, use_index=False)
+
+
+@benchmark("electricity_index_load")
+def bench_electricity_index(size):
+    path = electricity_csv(size)
+    electricity.load_stats(path)
+    return lambda: electricity.load_stats(path)
+
+
+@benchmark("electricity_reports")
+def bench_electricity_reports(size):
+    stats, _ = electricity.load_stats(electricity_csv(size), use_index=False)
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            electricity.batch(stats)
+
+    return run
+
+
+# Function to time a function; returns the timings of at least repeat calls in
+# seconds, repeating fast functions until they have run for min_time. Slow
+# functions stop early after max_time, with at least one timing
+def measure(function, repeat, min_time=0.2, max_time=20.0):
+    function()  # warm up caches and lazily built tables
+    timings = []
+    started = time.perf_counter()
+    while True:
+        begin = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - begin)
+        elapsed = time.perf_counter() - started
+        if elapsed > max_time or len(timings) >= 100 * repeat:
+            break
+        if len(timings) >= repeat and elapsed >= min_time:
+            break
+    return timings
+
+
+# Function to run the selected benchmarks; returns the results as a dict of
+# "name[size]" -> timing summary
+def run_benchmarks(sizes, repeat, selected=None):
+    results = {}
+    for size in sizes:
+        for name, setup in BENCHMARKS:
+            if selected and not any(part in name for part in selected):
+                continue
+            key = f"{name}[{size}]"
+            timings = measure(setup(size), repeat)
+            results[key] = {
+                "min": min(timings),
+                "median": statistics.median(timings),
+                "runs": len(timings),
+            }
+            print(f"{key:<40}{results[key]['median'] * 1000:>12.3f} ms", file=sys.stderr)
+        worlds.pop(size, None)
+    return results
+
+
+# Function to describe the machine and versions a run was made with
+def environment():
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "seed": SEED,
+    }
+
+
+# Function to compare results with a baseline; returns the names of the
+# benchmarks slower than the baseline by more than threshold (by median)
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    regressions = []
+    print(f"\n{'benchmark':<40}{'baseline':>12}{'current':>12}{'ratio':>8}", file=sys.stderr)
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        before, after = baseline[key]["median"], result["median"]
+        ratio = after / before if before > 0 else float("inf")
+        flag = "  slower" if ratio > threshold else ("  faster" if ratio < 1 / threshold else "")
+        print(f"{key:<40}{before * 1000:>10.2f}ms{after * 1000:>10.2f}ms{ratio:>8.2f}{flag}", file=sys.stderr)
+        if ratio > threshold:
+            regressions.append(key)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seeded benchmarks of the map and analysis hot paths")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="map sizes to run at")
+    parser.add_argument("--repeat", type=int, default=5, help="minimum timed runs per benchmark")
+    parser.add_argument(
+        "--only", nargs="+", metavar="NAME", help="run only benchmarks whose name contains one of these"
+    )
+    parser.add_argument("--output", help="write the results as JSON to this file (default: stdout)")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline JSON to compare against")
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="store the results as the new baseline"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=REGRESSION_THRESHOLD,
+        help="slowdown ratio reported as a regression",
+    )
+    args = parser.parse_args()
+
+    report = {
+        "environment": environment(),
+        "results": run_benchmarks(args.sizes, args.repeat, args.only),
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.save_baseline:
+        # Keep the entries of benchmarks that were not run this time
+        baseline = {"results": {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline["environment"] = report["environment"]
+        baseline["results"].update(report["results"])
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(report["results"], json.load(f)["results"], args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
@@ -0,0 +1,105 @@
+import numpy as np
+from scipy.ndimage import find_objects
+from worldgen import BLOCK_SIZE, STREAM_CAVES, world_rng
+
+# Cave generation inside map regions with a cellular automaton, vectorized over
+# the whole map: every region to carve is one mask, and each generation is a few
+# whole-array operations instead of a Python loop per cell and per region.
+#
+# Share of cells open in the initial random fill
+CAVE_OPEN_PROBABILITY = 0.55
+# Number of automaton generations
+CAVE_GENERATIONS = 5
+# An open cell stays open with at least CAVE_SURVIVE open neighbours; a closed
+# cell opens with at least CAVE_BIRTH
+CAVE_SURVIVE = 4
+CAVE_BIRTH = 5
+
+
+# Function to draw the initial random fill of a window of the map, True where a
+# cell starts open; drawn in blocks like the walls, so it only depends on the
+# seed and not on the window
+def random_fill(top, left, bottom, right, seed, probability=CAVE_OPEN_PROBABILITY):
+    cells = np.empty((bottom - top, right - left), dtype=bool)
+    for y0 in range(top // BLOCK_SIZE * BLOCK_SIZE, bottom, BLOCK_SIZE):
+        for x0 in range(left // BLOCK_SIZE * BLOCK_SIZE, right, BLOCK_SIZE):
+            draws = world_rng(seed, STREAM_CAVES, y0 // BLOCK_SIZE, x0 // BLOCK_SIZE).random(
+                (BLOCK_SIZE, BLOCK_SIZE), dtype=np.float32
+            )
+            y1, x1 = max(y0, top), max(x0, left)
+            y2, x2 = min(y0 + BLOCK_SIZE, bottom), min(x0 + BLOCK_SIZE, right)
+            cells[y1 - top : y2 - top, x1 - left : x2 - left] = (
+                draws[y1 - y0 : y2 - y0, x1 - x0 : x2 - x0] < probability
+            )
+    return cells
+
+
+# Function to count the open cells among the 8 neighbours of every cell: the 3x3
+# box sum, computed as a sum of row shifts then of column shifts, minus the cell
+# itself; cells off the grid count as closed
+def neighbour_counts(cells):
+    height, width = cells.shape
+    padded = np.zeros((height + 2, width + 2), dtype=np.uint8)
+    padded[1:-1, 1:-1] = cells
+    rows = padded[:, :-2] + padded[:, 1:-1] + padded[:, 2:]
+    return rows[:-2] + rows[1:-1] + rows[2:] - padded[1:-1, 1:-1]
+
+
+# Function to run the automaton; only cells under the mask change, the others
+# keep their state and still count as neighbours
+def run_automaton(cells, mask, generations=CAVE_GENERATIONS, survive=CAVE_SURVIVE, birth=CAVE_BIRTH):
+    # An open cell needs survive open neighbours, a closed one birth
+    cells = cells.astype(np.uint8)
+    keep = (~mask).astype(np.uint8)
+    for _ in range(generations):
+        threshold = birth - (birth - survive) * cells
+        cells = ((neighbour_counts(cells) >= threshold) & mask) | (cells & keep)
+        cells = cells.astype(np.uint8, copy=False)
+    return cells.astype(bool)
+
+
+# Function to find the border cells of every region in a mask at once: a cell is
+# on a border if a 4-neighbour has a different label (or lies off the grid)
+def region_borders(labels, mask):
+    padded = np.pad(labels, 1)  # label 0 is never part of a region
+    inner = padded[1:-1, 1:-1]
+    same = (
+        (padded[:-2, 1:-1] == inner)
+        & (padded[2:, 1:-1] == inner)
+        & (padded[1:-1, :-2] == inner)
+        & (padded[1:-1, 2:] == inner)
+    )
+    return mask & ~same
+
+
+# Function to carve caves into labelled regions in one batch: all the given
+# labels are processed together, restricted to the bounding box around their
+# objects (pass the find_objects result if it is at hand). Returns a boolean
+# grid, True where a cell is open cave; the edge of each region stays closed so
+# every cave keeps a solid border
+def generate_caves(labels, region_ids, seed, objects=None, generations=CAVE_GENERATIONS):
+    caves = np.zeros(labels.shape, dtype=bool)
+    region_ids = np.asarray(region_ids, dtype=np.intp)
+    if region_ids.size == 0:
+        return caves
+    if objects is None:
+        objects = find_objects(labels, max_label=int(region_ids.max()))
+    objects = [objects[region_id - 1] for region_id in region_ids if objects[region_id - 1] is not None]
+    if not objects:
+        return caves
+
+    # Work only on the box around the regions, with a one-cell margin so the
+    # neighbour counts at its edge see the same cells as on the full map
+    top = max(min(rows.start for rows, _ in objects) - 1, 0)
+    left = max(min(cols.start for _, cols in objects) - 1, 0)
+    bottom = min(max(rows.stop for rows, _ in objects) + 1, labels.shape[0])
+    right = min(max(cols.stop for _, cols in objects) + 1, labels.shape[1])
+    box = (slice(top, bottom), slice(left, right))
+
+    selected = np.zeros(max(int(labels[box].max()), int(region_ids.max())) + 1, dtype=bool)
+    selected[region_ids] = True
+    mask = selected[labels[box]]
+    cells = random_fill(top, left, bottom, right, seed)
+    cells = run_automaton(cells, mask, generations)
+    caves[box] = cells & mask & ~region_borders(labels[box], mask)
+    return caves
@@ -0,0 +1,153 @@
+from collections import OrderedDict
+import os
+import threading
+import numpy as np
+from worldgen import (
+    BLOCK_SIZE,
+    CELL_DTYPE,
+    CLUSTER_REGION_TYPES,
+    NORMAL,
+    NO_WALL,
+    STREAM_REGION_NOISE,
+    generate_walls_for_block,
+    perlin_noise,
+)
+
+# Unbounded world generated lazily, one BLOCK_SIZE block at a time, from the seed
+# alone. Noise is evaluated at absolute world coordinates, so neighbouring blocks
+# line up without seams, and wall draws use the per-block random streams. The
+# finite world labels its noise clusters over the whole map and normalizes the
+# noise to its global range; neither is possible block by block, so here a cell
+# belongs to a cluster when its raw noise is below a fixed threshold, and the
+# cluster's region type comes from a second, slower-varying noise field.
+#
+# Raw noise below this is inside a cluster (the finite world's normalized 0.5 is
+# close to raw 0)
+REGION_THRESHOLD = 0.0
+# Scale of the region type noise: several clusters wide, so a cluster mostly has one type
+REGION_TYPE_SCALE = 60.0
+# Noise repeat period; large enough that the world never visibly repeats
+NOISE_REPEAT = 1 << 24
+
+
+# Function to map a (possibly negative) block coordinate to a non-negative
+# random stream key
+def block_key(n):
+    return 2 * n if n >= 0 else -2 * n - 1
+
+
+# Function to generate the region types of a window of the unbounded world
+def generate_block_regions(x0, y0, width, height, seed):
+    noise = perlin_noise(x0, y0, width, height, seed, NOISE_REPEAT, NOISE_REPEAT)
+    type_noise = perlin_noise(
+        x0,
+        y0,
+        width,
+        height,
+        seed,
+        NOISE_REPEAT,
+        NOISE_REPEAT,
+        octaves=1,
+        scale=REGION_TYPE_SCALE,
+        stream=STREAM_REGION_NOISE,
+    )
+    # Raw noise spans about -0.7..0.7; spread the middle of it over the types
+    types = np.asarray(CLUSTER_REGION_TYPES, dtype=CELL_DTYPE)
+    index = np.clip(((type_noise + 0.5) * len(types)).astype(np.intp), 0, len(types) - 1)
+    return np.where(noise < REGION_THRESHOLD, types[index], NORMAL).astype(CELL_DTYPE)
+
+
+# Function to generate the walls of one block of the unbounded world
+def generate_block(block_x, block_y, seed):
+    regions = generate_block_regions(
+        block_x * BLOCK_SIZE, block_y * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE, seed
+    )
+    return generate_walls_for_block(regions, seed, block_key(block_y), block_key(block_x))
+
+
+# The unbounded world as seen by the server: slicing it like the finite maze
+# array, world[min_y:max_y, min_x:max_x], assembles the window from blocks. Blocks
+# are generated on first use and kept in a least-recently-used cache of
+# max_blocks blocks; with spill_dir, evicted blocks are written there and read
+# back instead of being generated again. Safe to share between threads
+class ChunkedWorld:
+    def __init__(self, seed, max_blocks=256, spill_dir=None):
+        self.seed = seed
+        self.max_blocks = max_blocks
+        self.spill_dir = spill_dir
+        self.blocks = OrderedDict()  # (block_x, block_y) -> wall states
+        self.lock = threading.Lock()
+        self.generated = 0
+        self.loaded = 0
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def spill_path(self, block):
+        return os.path.join(self.spill_dir, f"block_{self.seed}_{block[0]}_{block[1]}.npy")
+
+    # Get one block, from the cache, the spill directory or the generator
+    def block(self, block_x, block_y):
+        block = (block_x, block_y)
+        with self.lock:
+            cells = self.blocks.get(block)
+            if cells is not None:
+                self.blocks.move_to_end(block)
+                return cells
+
+        if self.spill_dir is not None and os.path.exists(self.spill_path(block)):
+            cells = np.load(self.spill_path(block))
+            self.loaded += 1
+        else:
+            cells = generate_block(block_x, block_y, self.seed)
+            self.generated += 1
+        cells.setflags(write=False)
+
+        with self.lock:
+            self.blocks[block] = cells
+            evicted = []
+            while len(self.blocks) > self.max_blocks:
+                evicted.append(self.blocks.popitem(last=False))
+        for old_block, old_cells in evicted:
+            self.spill(old_block, old_cells)
+        return cells
+
+    # Write an evicted block to the spill directory (once; blocks never change)
+    def spill(self, block, cells):
+        if self.spill_dir is None or os.path.exists(self.spill_path(block)):
+            return
+        temporary = self.spill_path(block) + ".tmp.npy"
+        np.save(temporary, cells)
+        os.replace(temporary, self.spill_path(block))
+
+    # Assemble a window of world cells given as (min_x, min_y, max_x, max_y)
+    def window(self, min_x, min_y, max_x, max_y):
+        cells = np.empty((max(max_y - min_y, 0), max(max_x - min_x, 0)), dtype=CELL_DTYPE)
+        if cells.size == 0:
+            return cells
+        for block_y in range(min_y // BLOCK_SIZE, (max_y - 1) // BLOCK_SIZE + 1):
+            for block_x in range(min_x // BLOCK_SIZE, (max_x - 1) // BLOCK_SIZE + 1):
+                x0, y0 = block_x * BLOCK_SIZE, block_y * BLOCK_SIZE
+                left, top = max(x0, min_x), max(y0, min_y)
+                right = min(x0 + BLOCK_SIZE, max_x)
+                bottom = min(y0 + BLOCK_SIZE, max_y)
+                cells[top - min_y : bottom - min_y, left - min_x : right - min_x] = self.block(
+                    block_x, block_y
+                )[top - y0 : bottom - y0, left - x0 : right - x0]
+        return cells
+
+    def __getitem__(self, key):
+        rows, cols = key
+        return self.window(cols.start, rows.start, cols.stop, rows.stop)
+
+    # Function to pick a random NO_WALL cell within radius blocks of the origin
+    def find_spawn(self, rng, radius=4):
+        while True:
+            block_x = rng.randint(-radius, radius - 1)
+            block_y = rng.randint(-radius, radius - 1)
+            ys, xs = np.nonzero(self.block(block_x, block_y) == NO_WALL)
+            if len(xs):
+                pick = rng.randrange(len(xs))
+                return (
+                    block_x * BLOCK_SIZE + int(xs[pick]),
+                    block_y * BLOCK_SIZE + int(ys[pick]),
+                )
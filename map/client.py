@@ -1,14 +1,23 @@
+import math
 import socket
+import select
 import pygame
-import pickle
 import time
-
-# Define the states for each cell (same as the server)
-NO_WALL = 0
-HORIZONTAL_WALL = 1
-VERTICAL_WALL = 2
-SLASH_FORWARD_WALL = 3
-SLASH_BACKWARD_WALL = 4
+from protocol import (
+    MSG_SPAWN,
+    MSG_TILE_REQUEST,
+    MSG_TILE,
+    MSG_CELL,
+    TILE_SIZE,
+    recv_frame,
+    recv_message,
+    send_position,
+    decode_position,
+    decode_chunk,
+)
+from tilecache import TileCache
+from collision import collides
+from renderer import TileRenderer, draw_frame_stats
 
 # Pygame setup
 pygame.init()
@@ -17,109 +26,113 @@ clock = pygame.time.Clock()
 
 # Grid size and chunk size
 GRID_SIZE = 16
-CHUNK_SIZE = 25  # Size of the chunk to request from the server, centered on player
+CHUNK_SIZE = 25  # Size of the chunk around the player that is collided with
+
+# Tile cache budget and how many frames ahead of the player tiles are prefetched
+TILE_CACHE_BYTES = 4 * 1024 * 1024
+PREFETCH_FRAMES = 30
 
 # Player properties
 PLAYER_RADIUS = 5
 PLAYER_COLOR = (255, 0, 0)
-PLAYER_SPEED = 2  # Speed of player movement
+PLAYER_SPEED = 2  # Speed of player movement, in pixels per frame
 velocity = pygame.Vector2(0, 0)  # Player's velocity (initially 0)
 
-# Colors for walls
+# Player radius in world cells, the unit positions and collisions work in
+PLAYER_CELL_RADIUS = PLAYER_RADIUS / GRID_SIZE
+
+# Colors for walls and the background
 WALL_COLOR = (0, 0, 0)
+BACKGROUND_COLOR = (255, 255, 255)
+
+# Frame rate and frame time overlay
+SHOW_FRAME_STATS = True
+stats_font = pygame.font.Font(None, 24)
 
 # Client setup
 client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 client_socket.connect(("localhost", 5555))
 
-# Receive initial player position from server
+# Receive initial player position from server and start in the middle of that cell
 player_position = pygame.Vector2(
-    *pickle.loads(client_socket.recv(1024))
-)  # Player position as a vector
+    *decode_position(recv_message(client_socket, MSG_SPAWN))
+) + pygame.Vector2(0.5, 0.5)  # Player position as a vector, in world cells
 print(f"Player spawned at: {player_position}")
 
-# Map chunk received from the server
+# World tiles received from the server
+tile_cache = TileCache(TILE_SIZE, TILE_CACHE_BYTES)
+
+# Renderer drawing each cached tile once into a surface and blitting the surfaces
+renderer = TileRenderer(tile_cache, GRID_SIZE, WALL_COLOR, BACKGROUND_COLOR)
+
+# Map chunk around the player, assembled from the tile cache
 maze_chunk = None
 
 
-# Function to request and receive a chunk of the maze centered around the player
-def request_maze_chunk(player_position):
-    client_socket.sendall(
-        pickle.dumps((int(player_position.x), int(player_position.y)))
-    )
-    data = client_socket.recv(16384)  # Increased buffer size for larger chunks
-    return pickle.loads(data)
-
-
-# Function to check if the player collides with any walls
-def check_collision_with_walls(
-    player_position, maze_chunk, chunk_offset_x, chunk_offset_y
-):
-    player_x, player_y = player_position.x, player_position.y
-    # Translate chunk coordinates into global screen coordinates
-    for y in range(len(maze_chunk)):
-        for x in range(len(maze_chunk[y])):
-            screen_x = (x - (CHUNK_SIZE // 2)) * GRID_SIZE + screen.get_width() // 2
-            screen_y = (y - (CHUNK_SIZE // 2)) * GRID_SIZE + screen.get_height() // 2
-
-            # Horizontal wall collision check
-            if maze_chunk[y][x] == HORIZONTAL_WALL:
-                if (
-                    player_y + PLAYER_RADIUS > screen_y
-                    and player_y - PLAYER_RADIUS < screen_y
-                    and screen_x <= player_x <= screen_x + GRID_SIZE
-                ):
-                    return True
-
-            # Vertical wall collision check
-            elif maze_chunk[y][x] == VERTICAL_WALL:
-                if (
-                    player_x + PLAYER_RADIUS > screen_x
-                    and player_x - PLAYER_RADIUS < screen_x
-                    and screen_y <= player_y <= screen_y + GRID_SIZE
-                ):
-                    return True
-
-            # Forward slash (/) wall collision check
-            elif maze_chunk[y][x] == SLASH_FORWARD_WALL:
-                if intersects_with_forward_slash(
-                    player_x, player_y, screen_x, screen_y
-                ):
-                    return True
-
-            # Backward slash (\) wall collision check
-            elif maze_chunk[y][x] == SLASH_BACKWARD_WALL:
-                if intersects_with_backward_slash(
-                    player_x, player_y, screen_x, screen_y
-                ):
-                    return True
-
-    return False  # No collision
-
-
-# Function to check if the player intersects with a forward slash (/)
-def intersects_with_forward_slash(player_x, player_y, line_x, line_y):
-    # Forward slash (/) line: top-left to bottom-right
-    dx = player_x - line_x
-    dy = player_y - line_y
-    return abs(dx - dy) < PLAYER_RADIUS
-
-
-# Function to check if the player intersects with a backward slash (\)
-def intersects_with_backward_slash(player_x, player_y, line_x, line_y):
-    # Backward slash (\) line: top-right to bottom-left
-    dx = player_x - line_x
-    dy = player_y - line_y
-    return abs(dx + dy - GRID_SIZE) < PLAYER_RADIUS
-
-
-# Initial chunk request
-maze_chunk = request_maze_chunk(player_position)
-
-# Game loop
+# Function to get the window of world cells (min_x, min_y, max_x, max_y) centered on a position
+def chunk_bounds(position):
+    min_x = int(position.x) - (CHUNK_SIZE // 2)
+    min_y = int(position.y) - (CHUNK_SIZE // 2)
+    return min_x, min_y, min_x + CHUNK_SIZE, min_y + CHUNK_SIZE
+
+
+# Function to check whether the tiles of every cell under the player at a
+# position are cached
+def covered(position):
+    min_x = math.floor(position.x - PLAYER_CELL_RADIUS)
+    min_y = math.floor(position.y - PLAYER_CELL_RADIUS)
+    max_x = math.floor(position.x + PLAYER_CELL_RADIUS) + 1
+    max_y = math.floor(position.y + PLAYER_CELL_RADIUS) + 1
+    return tile_cache.covers(min_x, min_y, max_x, max_y)
+
+
+# Function to request every tile of a window that is not cached or on its way
+def request_tiles(bounds):
+    for tile in tile_cache.missing(*bounds):
+        send_position(client_socket, MSG_TILE_REQUEST, *tile)
+        tile_cache.pending.add(tile)
+
+
+# Function to get the window of world cells visible on screen around a position
+def view_bounds(position):
+    return renderer.visible_bounds(screen, position.x, position.y)
+
+
+# Function to request the tiles on screen and, ahead of them, the tiles the
+# player will see next in the direction of travel (velocity in cells per frame)
+def prefetch_tiles(player_position, velocity):
+    request_tiles(view_bounds(player_position))
+    if velocity.x or velocity.y:
+        request_tiles(view_bounds(player_position + velocity * PREFETCH_FRAMES))
+
+
+# Function to store every tile that has arrived; only waits if wait is True
+def receive_tiles(wait=False):
+    timeout = None if wait else 0
+    while select.select([client_socket], [], [], timeout)[0]:
+        frame = recv_frame(client_socket)
+        if frame is None:
+            raise ConnectionError("server closed the connection")
+        msg_type, payload = frame
+        if msg_type != MSG_TILE:
+            raise ValueError(f"unexpected message type {msg_type}")
+        origin_x, origin_y, cells = decode_chunk(payload)
+        tile_cache.put((origin_x // TILE_SIZE, origin_y // TILE_SIZE), cells)
+        timeout = 0
+
+
+# Initial tile requests; this is the only time the client waits on the network
+request_tiles(view_bounds(player_position))
+while tile_cache.pending:
+    receive_tiles(wait=True)
+maze_chunk = tile_cache.window(*chunk_bounds(player_position))
+
+# Game loop; the spawn cell is where the server already tracks the player
+reported_cell = (int(player_position.x), int(player_position.y))
 running = True
+frame_time = 0.0
 while running:
-    screen.fill((255, 255, 255))  # White background
+    frame_start = time.perf_counter()
 
     # Handle events
     for event in pygame.event.get():
@@ -140,68 +153,51 @@ while running:
     if keys[pygame.K_DOWN]:
         velocity.y = PLAYER_SPEED
 
-    # Calculate the new position based on velocity
-    new_position = player_position + velocity
-
-    # Calculate chunk offset (where the chunk starts relative to the player)
-    chunk_offset_x = int(player_position.x) - (CHUNK_SIZE // 2)
-    chunk_offset_y = int(player_position.y) - (CHUNK_SIZE // 2)
-
-    # Check for wall collisions before allowing movement
-    if not check_collision_with_walls(
-        new_position, maze_chunk, chunk_offset_x, chunk_offset_y
+    # Calculate the new position based on velocity (pixels to world cells)
+    new_position = player_position + velocity / GRID_SIZE
+
+    # Calculate chunk offset (where the chunk starts in world cells)
+    chunk_offset_x, chunk_offset_y, _, _ = chunk_bounds(player_position)
+
+    # Check for wall collisions before allowing movement; only the few cells
+    # under the player are tested. Cells whose tile has not arrived yet, or that
+    # lie outside the world, cannot be entered
+    if covered(new_position) and not collides(
+        maze_chunk,
+        chunk_offset_x,
+        chunk_offset_y,
+        new_position.x,
+        new_position.y,
+        PLAYER_CELL_RADIUS,
     ):
         player_position = new_position  # Apply the movement
-        # Request new maze chunk when the player moves
-        maze_chunk = request_maze_chunk(player_position)
 
-    # Center player in the middle of the screen
-    center_x, center_y = screen.get_width() // 2, screen.get_height() // 2
+    # Tell the server which cell the player is in when it changes, so it can keep
+    # new players spawning away from this one
+    cell = (int(player_position.x), int(player_position.y))
+    if cell != reported_cell:
+        send_position(client_socket, MSG_CELL, *cell)
+        reported_cell = cell
+
+    # Prefetch tiles in the direction of travel and store the ones that arrived
+    prefetch_tiles(player_position, velocity / GRID_SIZE)
+    receive_tiles()
 
-    # Draw the maze chunk around the player
-    if maze_chunk is not None:
-        for y in range(len(maze_chunk)):
-            for x in range(len(maze_chunk[y])):
-                # Calculate screen coordinates relative to the player's position
-                screen_x = center_x + (x - (CHUNK_SIZE // 2)) * GRID_SIZE
-                screen_y = center_y + (y - (CHUNK_SIZE // 2)) * GRID_SIZE
-
-                if maze_chunk[y][x] == HORIZONTAL_WALL:
-                    pygame.draw.line(
-                        screen,
-                        WALL_COLOR,
-                        (screen_x, screen_y),
-                        (screen_x + GRID_SIZE, screen_y),
-                        2,
-                    )
-                elif maze_chunk[y][x] == VERTICAL_WALL:
-                    pygame.draw.line(
-                        screen,
-                        WALL_COLOR,
-                        (screen_x, screen_y),
-                        (screen_x, screen_y + GRID_SIZE),
-                        2,
-                    )
-                elif maze_chunk[y][x] == SLASH_FORWARD_WALL:
-                    pygame.draw.line(
-                        screen,
-                        WALL_COLOR,
-                        (screen_x, screen_y),
-                        (screen_x + GRID_SIZE, screen_y + GRID_SIZE),
-                        2,
-                    )
-                elif maze_chunk[y][x] == SLASH_BACKWARD_WALL:
-                    pygame.draw.line(
-                        screen,
-                        WALL_COLOR,
-                        (screen_x + GRID_SIZE, screen_y),
-                        (screen_x, screen_y + GRID_SIZE),
-                        2,
-                    )
+    # Read the chunk around the player from the local tile cache
+    maze_chunk = tile_cache.window(*chunk_bounds(player_position))
+
+    # Draw the world from the cached tile surfaces, centered on the player
+    renderer.draw(screen, player_position.x, player_position.y)
 
     # Draw the player as a dot in the center of the screen
+    center_x, center_y = screen.get_width() // 2, screen.get_height() // 2
     pygame.draw.circle(screen, PLAYER_COLOR, (center_x, center_y), PLAYER_RADIUS)
 
+    # Overlay the frame rate and the time the last frame took to produce
+    if SHOW_FRAME_STATS:
+        draw_frame_stats(screen, stats_font, clock, frame_time)
+    frame_time = time.perf_counter() - frame_start
+
     pygame.display.flip()
     clock.tick(60)
 
@@ -0,0 +1,84 @@
+import numpy as np
+from worldgen import (
+    NO_WALL,
+    HORIZONTAL_WALL,
+    VERTICAL_WALL,
+    SLASH_FORWARD_WALL,
+    SLASH_BACKWARD_WALL,
+)
+
+# Collision works in world cell units: cell (x, y) covers the unit square from
+# (x, y) to (x + 1, y + 1) and its wall is one segment inside that square. Only the
+# cells under the circle's bounding box can touch it, so a check looks at a fixed
+# handful of cells no matter how large the grid is.
+#
+# Segment of each wall state, as (x0, y0, x1, y1) offsets from the cell corner
+WALL_SEGMENTS = np.zeros((5, 4), dtype=np.float64)
+WALL_SEGMENTS[HORIZONTAL_WALL] = (0, 0, 1, 0)  # top edge
+WALL_SEGMENTS[VERTICAL_WALL] = (0, 0, 0, 1)  # left edge
+WALL_SEGMENTS[SLASH_FORWARD_WALL] = (0, 0, 1, 1)  # top-left to bottom-right
+WALL_SEGMENTS[SLASH_BACKWARD_WALL] = (1, 0, 0, 1)  # top-right to bottom-left
+
+
+# Function to get the offsets of the cells that can touch a circle of this radius
+# relative to the cell under the circle's top-left bounding box corner
+def candidate_offsets(radius):
+    span = int(np.floor(2 * radius)) + 2
+    dy, dx = np.mgrid[0:span, 0:span]
+    return dx.ravel(), dy.ravel()
+
+
+# Function to check many circles against the walls of a grid at once. grid holds
+# the wall states of the cells starting at world cell (origin_x, origin_y); cells
+# outside it count as open. Returns a boolean array, True where a circle touches a wall
+def collides_batch(grid, origin_x, origin_y, xs, ys, radius):
+    xs = np.asarray(xs, dtype=np.float64)[:, np.newaxis]
+    ys = np.asarray(ys, dtype=np.float64)[:, np.newaxis]
+    dx, dy = candidate_offsets(radius)
+
+    # Candidate cells per circle, in world coordinates and in grid indices
+    cell_x = np.floor(xs - radius).astype(np.intp) + dx
+    cell_y = np.floor(ys - radius).astype(np.intp) + dy
+    col = cell_x - origin_x
+    row = cell_y - origin_y
+    inside = (row >= 0) & (row < grid.shape[0]) & (col >= 0) & (col < grid.shape[1])
+    walls = np.where(
+        inside,
+        grid[np.where(inside, row, 0), np.where(inside, col, 0)],
+        NO_WALL,
+    )
+
+    # Closest point on every candidate segment to the circle's center
+    segments = WALL_SEGMENTS[walls]
+    ax = cell_x + segments[..., 0]
+    ay = cell_y + segments[..., 1]
+    bx = cell_x + segments[..., 2]
+    by = cell_y + segments[..., 3]
+    ex, ey = bx - ax, by - ay
+    length2 = ex * ex + ey * ey
+    t = np.clip(
+        ((xs - ax) * ex + (ys - ay) * ey) / np.where(length2 > 0, length2, 1), 0, 1
+    )
+    px = ax + t * ex - xs
+    py = ay + t * ey - ys
+
+    hits = (walls != NO_WALL) & (px * px + py * py < radius * radius)
+    return hits.any(axis=1)
+
+
+# Function to check if a circle at (x, y) touches any wall of the grid
+def collides(grid, origin_x, origin_y, x, y, radius):
+    return bool(collides_batch(grid, origin_x, origin_y, [x], [y], radius)[0])
+
+
+# Function to validate a move from (x0, y0) to (x1, y1) for authoritative
+# movement checks: the circle is swept in steps no longer than its radius so a
+# long move cannot tunnel through a wall
+def move_collides(grid, origin_x, origin_y, x0, y0, x1, y1, radius):
+    distance = np.hypot(x1 - x0, y1 - y0)
+    steps = max(int(np.ceil(distance / radius)), 1)
+    t = np.linspace(0, 1, steps + 1)[1:]
+    hits = collides_batch(
+        grid, origin_x, origin_y, x0 + t * (x1 - x0), y0 + t * (y1 - y0), radius
+    )
+    return bool(hits.any())
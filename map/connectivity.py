@@ -0,0 +1,266 @@
+import numpy as np
+from scipy.ndimage import distance_transform_edt, label
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components, dijkstra, minimum_spanning_tree
+from worldgen import (
+    NO_WALL,
+    HORIZONTAL_WALL,
+    VERTICAL_WALL,
+    SLASH_FORWARD_WALL,
+    SLASH_BACKWARD_WALL,
+)
+from pathfinding import passable_moves, move_graph
+
+# Connectivity repair: join every connected component of a grid with as little
+# carving as possible. Each cell is assigned to the component of its nearest open
+# cell (a distance transform), so two neighbouring cells owned by different
+# components mark the cheapest gap between them. The cheapest gap per pair of
+# components gives a small component graph; its minimum spanning tree picks the
+# tunnels, which are all carved at once.
+
+
+# Function to find the cheapest gap between every pair of neighbouring
+# components. labels holds the component of each open cell (0 elsewhere).
+# Returns arrays (component_a, component_b, cost, cell_a, cell_b), one entry per
+# pair, where cell_a and cell_b are neighbouring flat cell indices
+def component_gaps(labels, open_cells):
+    height, width = labels.shape
+    distance, (nearest_y, nearest_x) = distance_transform_edt(~open_cells, return_indices=True)
+    owner = labels[nearest_y, nearest_x].ravel()
+    distance = distance.ravel()
+    index = np.arange(height * width).reshape(height, width)
+
+    cells_a = np.concatenate([index[:, :-1].ravel(), index[:-1, :].ravel()])
+    cells_b = np.concatenate([index[:, 1:].ravel(), index[1:, :].ravel()])
+    different = owner[cells_a] != owner[cells_b]
+    cells_a, cells_b = cells_a[different], cells_b[different]
+    component_a = np.minimum(owner[cells_a], owner[cells_b])
+    component_b = np.maximum(owner[cells_a], owner[cells_b])
+    cost = distance[cells_a] + distance[cells_b] + 1
+
+    # Keep the cheapest gap of each pair of components
+    order = np.lexsort((cost, component_b, component_a))
+    component_a = component_a[order].astype(np.int64)
+    component_b = component_b[order].astype(np.int64)
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (component_a[1:] != component_a[:-1]) | (component_b[1:] != component_b[:-1])
+    keep = order[first]
+    return (
+        component_a[first],
+        component_b[first],
+        cost[keep],
+        cells_a[keep],
+        cells_b[keep],
+    )
+
+
+# Function to lay out straight-then-turning (horizontal, then vertical) paths
+# between many pairs of cells at once. Returns (path, step, y, x) arrays listing
+# every cell of every path, ends included, in order
+def manhattan_paths(start_y, start_x, end_y, end_x):
+    dx = end_x - start_x
+    dy = end_y - start_y
+    length = np.abs(dx) + np.abs(dy) + 1
+    path = np.repeat(np.arange(len(length)), length)
+    step = np.arange(length.sum()) - np.repeat(np.cumsum(length) - length, length)
+    across = np.abs(dx)[path]
+    horizontal = step <= across
+    x = np.where(horizontal, start_x[path] + np.sign(dx)[path] * step, end_x[path])
+    y = np.where(
+        horizontal, start_y[path], start_y[path] + np.sign(dy)[path] * (step - across)
+    )
+    return path, step, y, x
+
+
+# Function to pick the tunnels joining all components: the minimum spanning tree
+# of the component graph. Every tunnel runs from the nearest open cell of one
+# side of its gap, across the gap, to the nearest open cell of the other side.
+# Returns (tunnel, y, x) arrays listing the cells of every tunnel in order
+def spanning_tunnels(labels, open_cells):
+    height, width = labels.shape
+    num_components = int(labels.max())
+    empty = np.zeros(0, dtype=np.intp)
+    if num_components < 2:
+        return empty, empty, empty
+
+    component_a, component_b, cost, cells_a, cells_b = component_gaps(labels, open_cells)
+    graph = csr_matrix(
+        (cost, (component_a, component_b)), shape=(num_components + 1, num_components + 1)
+    )
+    tree = minimum_spanning_tree(graph).tocoo()
+    # Map the chosen component pairs back to their gaps (sorted by pair)
+    rows, cols = tree.row.astype(np.int64), tree.col.astype(np.int64)
+    pairs = component_a * (num_components + 1) + component_b
+    chosen = np.searchsorted(
+        pairs, np.minimum(rows, cols) * (num_components + 1) + np.maximum(rows, cols)
+    )
+
+    _, (nearest_y, nearest_x) = distance_transform_edt(~open_cells, return_indices=True)
+    gap_a, gap_b = cells_a[chosen], cells_b[chosen]
+    a_y, a_x = gap_a // width, gap_a % width
+    b_y, b_x = gap_b // width, gap_b % width
+    waypoints = [
+        (nearest_y[a_y, a_x], nearest_x[a_y, a_x]),
+        (a_y, a_x),
+        (b_y, b_x),
+        (nearest_y[b_y, b_x], nearest_x[b_y, b_x]),
+    ]
+
+    # Each tunnel is three legs: open cell to gap, across the gap, gap to open cell
+    tunnels, legs, steps, ys, xs = [], [], [], [], []
+    for leg, ((y0, x0), (y1, x1)) in enumerate(zip(waypoints, waypoints[1:])):
+        path, step, y, x = manhattan_paths(y0, x0, y1, x1)
+        tunnels.append(path)
+        legs.append(np.full(len(path), leg))
+        steps.append(step)
+        ys.append(y)
+        xs.append(x)
+    tunnel, leg, step = np.concatenate(tunnels), np.concatenate(legs), np.concatenate(steps)
+    order = np.lexsort((step, leg, tunnel))
+    return tunnel[order], np.concatenate(ys)[order], np.concatenate(xs)[order]
+
+
+# Function to pick the tunnels joining all components when tunnels must stay
+# inside the allowed cells. Distances are then measured through the allowed
+# cells only: one multi-source Dijkstra pass from every open cell gives each
+# allowed cell its nearest open cell and the number of cells to carve to reach
+# it, and the tunnels follow those shortest routes. Returns (y, x) arrays of the
+# cells to carve, or None if some component cannot be reached
+def allowed_tunnels(labels, open_cells, allowed):
+    height, width = labels.shape
+    num_components = int(labels.max())
+    index = np.arange(height * width).reshape(height, width)
+    open_flat, allowed_flat = open_cells.ravel(), allowed.ravel()
+
+    # Moves between neighbouring allowed cells, costing 1 to enter a closed cell
+    pairs = [
+        (index[:, :-1].ravel(), index[:, 1:].ravel()),
+        (index[:-1, :].ravel(), index[1:, :].ravel()),
+    ]
+    sources, targets = [], []
+    for cell_a, cell_b in pairs:
+        both = allowed_flat[cell_a] & allowed_flat[cell_b]
+        for source, target in ((cell_a[both], cell_b[both]), (cell_b[both], cell_a[both])):
+            into_closed = ~open_flat[target]
+            sources.append(source[into_closed])
+            targets.append(target[into_closed])
+    sources, targets = np.concatenate(sources), np.concatenate(targets)
+    graph = csr_matrix(
+        (np.ones(len(sources)), (sources, targets)), shape=(height * width, height * width)
+    )
+    distance, predecessors, nearest = dijkstra(
+        graph, indices=index[open_cells], min_only=True, return_predecessors=True
+    )
+    reached = np.isfinite(distance)
+    owner = np.where(reached, labels.ravel()[np.where(reached, nearest, 0)], 0)
+
+    # Cheapest gap per pair of components, between neighbouring reached cells
+    cells_a = np.concatenate([cell_a for cell_a, _ in pairs])
+    cells_b = np.concatenate([cell_b for _, cell_b in pairs])
+    gap = (owner[cells_a] != 0) & (owner[cells_b] != 0) & (owner[cells_a] != owner[cells_b])
+    cells_a, cells_b = cells_a[gap], cells_b[gap]
+    cost = distance[cells_a] + distance[cells_b]
+    component_a = np.minimum(owner[cells_a], owner[cells_b]).astype(np.int64)
+    component_b = np.maximum(owner[cells_a], owner[cells_b]).astype(np.int64)
+    order = np.lexsort((cost, component_b, component_a))
+    component_a, component_b = component_a[order], component_b[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (component_a[1:] != component_a[:-1]) | (component_b[1:] != component_b[:-1])
+    keep = order[first]
+    component_a, component_b = component_a[first], component_b[first]
+
+    size = num_components + 1
+    tree = minimum_spanning_tree(
+        csr_matrix((cost[keep], (component_a, component_b)), shape=(size, size))
+    ).tocoo()
+    if tree.nnz != num_components - 1:
+        return None
+    rows, cols = tree.row.astype(np.int64), tree.col.astype(np.int64)
+    chosen = keep[
+        np.searchsorted(
+            component_a * size + component_b, np.minimum(rows, cols) * size + np.maximum(rows, cols)
+        )
+    ]
+
+    # Carve from both cells of each gap back along the shortest routes
+    carve = []
+    for cell in np.concatenate([cells_a[chosen], cells_b[chosen]]).tolist():
+        while cell >= 0 and not open_flat[cell]:
+            carve.append(cell)
+            cell = predecessors[cell]
+    carve = np.array(carve, dtype=np.intp)
+    return carve // width, carve % width
+
+
+# Function to connect all open areas of a boolean cave grid (True is open) by
+# carving tunnels; returns the carved copy, verified with one label pass. With
+# allowed (a boolean grid), open cells outside it are dropped and tunnels are
+# only carved inside it; a ValueError is raised if the open areas cannot all be
+# joined that way
+def connect_caves(cave, allowed=None):
+    cave = np.asarray(cave, dtype=bool)
+    if allowed is not None:
+        allowed = np.asarray(allowed, dtype=bool)
+        cave = cave & allowed
+    labels, num_components = label(cave)
+    if num_components < 2:
+        return cave.copy()
+    if allowed is None:
+        _, ys, xs = spanning_tunnels(labels, cave)
+    else:
+        tunnels = allowed_tunnels(labels, cave, allowed)
+        if tunnels is None:
+            raise ValueError("cave cannot be connected within the allowed cells")
+        ys, xs = tunnels
+    carved = cave.copy()
+    carved[ys, xs] = True
+    if label(carved)[1] != 1:
+        raise RuntimeError("cave is still disconnected after carving tunnels")
+    return carved
+
+
+# Function to find the walkable components of a maze (see pathfinding), labelled
+# from 1; cells with a diagonal wall cannot be entered and get 0. Returns
+# (labels, number of components)
+def maze_components(maze):
+    maze = np.asarray(maze)
+    open_cells = (maze != SLASH_FORWARD_WALL) & (maze != SLASH_BACKWARD_WALL)
+    _, components = connected_components(move_graph(passable_moves(maze)), directed=False)
+    labels = np.zeros(maze.shape, dtype=np.int64)
+    unique, labels[open_cells] = np.unique(
+        components.reshape(maze.shape)[open_cells], return_inverse=True
+    )
+    labels[open_cells] += 1
+    return labels, len(unique)
+
+
+# Function to connect every walkable cell of a maze, so that any open cell (and
+# so any spawn) can reach any other. Tunnels only clear the walls in their way:
+# diagonal walls on tunnel cells, and the wall on the edge each tunnel step
+# crosses. Returns the repaired copy, verified with one components pass
+def connect_maze(maze):
+    maze = np.asarray(maze)
+    labels, num_components = maze_components(maze)
+    repaired = maze.copy()
+    if num_components < 2:
+        return repaired
+    open_cells = labels > 0
+    tunnel, ys, xs = spanning_tunnels(labels, open_cells)
+
+    # Every tunnel cell must be enterable
+    diagonal = ~open_cells[ys, xs]
+    repaired[ys[diagonal], xs[diagonal]] = NO_WALL
+
+    # A horizontal wall lies on its cell's top edge and a vertical wall on its
+    # left edge, so the cell owning the crossed edge is the lower or right one
+    step = tunnel[1:] == tunnel[:-1]
+    y0, x0, y1, x1 = ys[:-1][step], xs[:-1][step], ys[1:][step], xs[1:][step]
+    owner_y = np.maximum(y0, y1)
+    owner_x = np.maximum(x0, x1)
+    wall = np.where(y0 != y1, HORIZONTAL_WALL, np.where(x0 != x1, VERTICAL_WALL, NO_WALL))
+    blocked = (wall != NO_WALL) & (repaired[owner_y, owner_x] == wall)
+    repaired[owner_y[blocked], owner_x[blocked]] = NO_WALL
+
+    if maze_components(repaired)[1] != 1:
+        raise RuntimeError("maze is still disconnected after carving tunnels")
+    return repaired
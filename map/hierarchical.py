@@ -0,0 +1,264 @@
+from heapq import heappop, heappush
+import math
+import numpy as np
+from scipy.sparse.csgraph import connected_components, dijkstra
+from pathfinding import PathFinder, move_graph, EAST, SOUTH, SQRT2
+
+# Hierarchical path planning (HPA*). The maze is cut into square clusters. Where
+# two neighbouring clusters can be crossed, each maximal run of crossable border
+# cells that joins the same two connected areas of the clusters is an entrance,
+# and one or two cells on each side of it become abstract graph nodes. Inside a
+# cluster, nodes are linked by their shortest path costs within that cluster,
+# computed once. A query links start and goal into the
+# graph, searches the small abstract graph and refines each hop with local A*.
+#
+# Entrances at least this long get a transition at both ends instead of one in the middle
+ENTRANCE_SPLIT = 6
+
+
+class HierarchicalPathFinder:
+    def __init__(self, maze, cluster_size=32, diagonal=False, path_finder=None):
+        self.height, self.width = np.shape(maze)
+        self.cluster_size = cluster_size
+        self.diagonal = diagonal
+        self.clusters_x = -(-self.width // cluster_size)
+        self.clusters_y = -(-self.height // cluster_size)
+        self.path_finder = path_finder or PathFinder(maze, diagonal)
+        self.moves = self.path_finder.moves.reshape(self.height, self.width)
+
+        self.borders = {}  # (cluster, neighbour cluster) -> [(cell, cell)] transitions
+        self.inter = {}  # node -> {node across a border: cost}
+        self.intra = {}  # cluster -> {node: {node in the same cluster: cost}}
+        self.graphs = {}  # cluster -> (sparse cell graph, bounds, area label per cell)
+
+        for cluster_y in range(self.clusters_y):
+            for cluster_x in range(self.clusters_x):
+                self.graphs[(cluster_x, cluster_y)] = self.cluster_graph((cluster_x, cluster_y))
+        for cluster_y in range(self.clusters_y):
+            for cluster_x in range(self.clusters_x):
+                for neighbour in ((cluster_x + 1, cluster_y), (cluster_x, cluster_y + 1)):
+                    self.build_border((cluster_x, cluster_y), neighbour)
+        for cluster_y in range(self.clusters_y):
+            for cluster_x in range(self.clusters_x):
+                self.build_cluster((cluster_x, cluster_y))
+
+    # Cluster containing a flat cell index
+    def cluster_of(self, cell):
+        y, x = divmod(cell, self.width)
+        return (x // self.cluster_size, y // self.cluster_size)
+
+    # Cells covered by a cluster, as (min_x, min_y, max_x, max_y)
+    def cluster_bounds(self, cluster):
+        size = self.cluster_size
+        min_x, min_y = cluster[0] * size, cluster[1] * size
+        return min_x, min_y, min(min_x + size, self.width), min(min_y + size, self.height)
+
+    # Find the transitions across the border between a cluster and its east or
+    # south neighbour, replacing the ones found before
+    def build_border(self, cluster, neighbour):
+        for cell_a, cell_b in self.borders.pop((cluster, neighbour), []):
+            self.inter.get(cell_a, {}).pop(cell_b, None)
+            self.inter.get(cell_b, {}).pop(cell_a, None)
+        if neighbour[0] >= self.clusters_x or neighbour[1] >= self.clusters_y:
+            return
+
+        min_x, min_y, max_x, max_y = self.cluster_bounds(cluster)
+        if neighbour[0] > cluster[0]:
+            # Vertical border: last column of the cluster, crossed going east
+            crossable = (self.moves[min_y:max_y, max_x - 1] & EAST) != 0
+            cells = np.arange(min_y, max_y) * self.width + max_x - 1
+            step = 1
+        else:
+            # Horizontal border: last row of the cluster, crossed going south
+            crossable = (self.moves[max_y - 1, min_x:max_x] & SOUTH) != 0
+            cells = (max_y - 1) * self.width + np.arange(min_x, max_x)
+            step = self.width
+
+        # Split the crossable cells into maximal runs joining the same pair of
+        # areas (entrances), so every way across the border stays represented
+        near = self.area_labels(cluster, cells)
+        far = self.area_labels(neighbour, cells + step)
+        breaks = np.ones(len(cells) + 1, dtype=bool)
+        breaks[1:-1] = (
+            ~crossable[1:] | ~crossable[:-1] | (near[1:] != near[:-1]) | (far[1:] != far[:-1])
+        )
+        runs = np.flatnonzero(breaks)
+        transitions = []
+        for start, end in zip(runs[:-1], runs[1:]):
+            if not crossable[start]:
+                continue
+            picks = [start, end - 1] if end - start >= ENTRANCE_SPLIT else [(start + end - 1) // 2]
+            for pick in picks:
+                cell = int(cells[pick])
+                transitions.append((cell, cell + step))
+                self.inter.setdefault(cell, {})[cell + step] = 1.0
+                self.inter.setdefault(cell + step, {})[cell] = 1.0
+        self.borders[(cluster, neighbour)] = transitions
+
+    # Abstract nodes lying in a cluster, from the transitions on its four borders
+    def cluster_nodes(self, cluster):
+        cluster_x, cluster_y = cluster
+        nodes = set()
+        for key in (
+            (cluster, (cluster_x + 1, cluster_y)),
+            (cluster, (cluster_x, cluster_y + 1)),
+            ((cluster_x - 1, cluster_y), cluster),
+            ((cluster_x, cluster_y - 1), cluster),
+        ):
+            for cell_a, cell_b in self.borders.get(key, []):
+                nodes.update(cell for cell in (cell_a, cell_b) if self.cluster_of(cell) == cluster)
+        return sorted(nodes)
+
+    # Build the sparse graph of the moves that stay inside a cluster
+    def cluster_graph(self, cluster):
+        min_x, min_y, max_x, max_y = self.cluster_bounds(cluster)
+        graph = move_graph(self.moves[min_y:max_y, min_x:max_x], self.diagonal)
+        _, labels = connected_components(graph, directed=False)
+        return graph, (min_x, min_y, max_x, max_y), labels
+
+    # Connected area, within their cluster, of flat cell indices of that cluster
+    def area_labels(self, cluster, cells):
+        _, bounds, labels = self.graphs[cluster]
+        return labels[self.local_indices(cells, bounds)]
+
+    # Convert flat cell indices inside a cluster to indices of its cluster graph
+    def local_indices(self, cells, bounds):
+        min_x, min_y, max_x, _ = bounds
+        cells = np.asarray(cells)
+        return (cells // self.width - min_y) * (max_x - min_x) + cells % self.width - min_x
+
+    # Costs from each of the given cells to every node of its cluster, within the cluster
+    def costs_to_nodes(self, cluster, cells):
+        graph, bounds, _ = self.graphs[cluster]
+        nodes = list(self.intra[cluster])
+        if not nodes:
+            return [{} for _ in cells]
+        distances = dijkstra(graph, indices=self.local_indices(cells, bounds))
+        local_nodes = self.local_indices(nodes, bounds)
+        return [
+            {node: float(cost) for node, cost in zip(nodes, row[local_nodes]) if np.isfinite(cost)}
+            for row in distances
+        ]
+
+    # Recompute the costs between the nodes of a cluster
+    def build_cluster(self, cluster):
+        nodes = self.cluster_nodes(cluster)
+        self.intra[cluster] = {node: {} for node in nodes}
+        for node, costs in zip(nodes, self.costs_to_nodes(cluster, nodes)):
+            costs.pop(node, None)
+            self.intra[cluster][node] = costs
+
+    # Update the planner after the maze changed inside a rectangle of cells; only
+    # the clusters around the rectangle are rebuilt
+    def update(self, maze, min_x, min_y, max_x, max_y):
+        self.path_finder.update(maze, min_x, min_y, max_x, max_y)
+        size = self.cluster_size
+        touched = {
+            (cluster_x, cluster_y)
+            for cluster_y in range(max((min_y - 1) // size, 0), min(max_y // size, self.clusters_y - 1) + 1)
+            for cluster_x in range(max((min_x - 1) // size, 0), min(max_x // size, self.clusters_x - 1) + 1)
+        }
+
+        # Rebuild the graphs of the touched clusters and all of their borders, then
+        # the costs of every cluster on those borders
+        for cluster in touched:
+            self.graphs[cluster] = self.cluster_graph(cluster)
+        rebuild = set(touched)
+        for cluster_x, cluster_y in touched:
+            for cluster, neighbour in (
+                ((cluster_x, cluster_y), (cluster_x + 1, cluster_y)),
+                ((cluster_x, cluster_y), (cluster_x, cluster_y + 1)),
+                ((cluster_x - 1, cluster_y), (cluster_x, cluster_y)),
+                ((cluster_x, cluster_y - 1), (cluster_x, cluster_y)),
+            ):
+                if min(cluster) >= 0:
+                    self.build_border(cluster, neighbour)
+                    rebuild.update(
+                        c
+                        for c in (cluster, neighbour)
+                        if c[0] < self.clusters_x and c[1] < self.clusters_y
+                    )
+        for cluster in rebuild:
+            self.build_cluster(cluster)
+
+    # Lower bound of the cost between two flat cell indices
+    def estimate(self, cell, goal_x, goal_y):
+        y, x = divmod(cell, self.width)
+        dx, dy = abs(x - goal_x), abs(y - goal_y)
+        if self.diagonal:
+            return dx + dy + (SQRT2 - 2) * min(dx, dy)
+        return dx + dy
+
+    # Function to find the abstract route between two (x, y) cells; returns the
+    # list of waypoint cells from start to goal, or an empty list if there is none
+    def find_abstract_path(self, start, goal):
+        for x, y in (start, goal):
+            if not (0 <= x < self.width and 0 <= y < self.height):
+                return []
+        source = start[1] * self.width + start[0]
+        target = goal[1] * self.width + goal[0]
+        if source == target:
+            return [tuple(start)]
+        start_cluster, goal_cluster = self.cluster_of(source), self.cluster_of(target)
+
+        # Link start and goal into the abstract graph for this query only
+        start_edges = self.costs_to_nodes(start_cluster, [source])[0]
+        goal_edges = self.costs_to_nodes(goal_cluster, [target])[0]
+        start_edges.pop(source, None)
+        start_edges.update(self.inter.get(source, {}))
+        if start_cluster == goal_cluster:
+            graph, bounds, _ = self.graphs[start_cluster]
+            local = self.local_indices([source, target], bounds)
+            direct = dijkstra(graph, indices=local[0])[local[1]]
+            if np.isfinite(direct):
+                start_edges[target] = float(direct)
+
+        # A* over the abstract graph
+        goal_x, goal_y = goal
+        best = {source: 0.0}
+        came_from = {source: None}
+        frontier = [(self.estimate(source, goal_x, goal_y), 0.0, source)]
+        while frontier:
+            _, cost, node = heappop(frontier)
+            if cost > best.get(node, math.inf):
+                continue
+            if node == target:
+                break
+            if node == source:
+                neighbours = start_edges.items()
+            else:
+                cluster = self.cluster_of(node)
+                neighbours = list(self.intra[cluster].get(node, {}).items())
+                neighbours += self.inter.get(node, {}).items()
+                if cluster == goal_cluster and node in goal_edges:
+                    neighbours.append((target, goal_edges[node]))
+            for neighbour, step_cost in neighbours:
+                new_cost = cost + step_cost
+                if new_cost < best.get(neighbour, math.inf):
+                    best[neighbour] = new_cost
+                    came_from[neighbour] = node
+                    heappush(
+                        frontier,
+                        (new_cost + self.estimate(neighbour, goal_x, goal_y), new_cost, neighbour),
+                    )
+        else:
+            return []
+
+        path = []
+        node = target
+        while node is not None:
+            path.append((node % self.width, node // self.width))
+            node = came_from[node]
+        path.reverse()
+        return path
+
+    # Function to find a full route between two (x, y) cells: the abstract route
+    # refined hop by hop with local A*
+    def find_path(self, start, goal):
+        waypoints = self.find_abstract_path(start, goal)
+        if len(waypoints) < 2:
+            return waypoints
+        path = [waypoints[0]]
+        for hop_start, hop_goal in zip(waypoints, waypoints[1:]):
+            path += self.path_finder.find_path(hop_start, hop_goal, self.diagonal)[1:]
+        return path
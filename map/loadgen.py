@@ -0,0 +1,422 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import resource
+import time
+import numpy as np
+from protocol import (
+    FRAME_HEADER,
+    CHUNK_HEADER,
+    MAX_PAYLOAD,
+    MSG_SPAWN,
+    MSG_POSITION,
+    MSG_CHUNK,
+    MSG_STREAM,
+    MSG_DELTA,
+    MSG_TILE_REQUEST,
+    MSG_TILE,
+    MSG_CELL,
+    TILE_SIZE,
+    encode_position,
+    decode_position,
+    decode_chunk,
+    apply_delta,
+)
+from pathfinding import PathFinder
+from metrics import LatencyHistogram
+from tilecache import TileCache
+from worldgen import (
+    NO_WALL,
+    HORIZONTAL_WALL,
+    VERTICAL_WALL,
+    SLASH_FORWARD_WALL,
+    SLASH_BACKWARD_WALL,
+)
+
+# Headless load generator for the map server. Every simulated player is a
+# coroutine with its own connection: it spawns, then walks the maze and sends
+# one request at a time, waiting for the reply, like client.py does. Players
+# are spread over several processes, each with its own event loop, and the
+# latency histograms and counters of all processes are merged at the end.
+#
+# Server address (as in client.py)
+HOST, PORT = "localhost", 5555
+
+# Request modes: the message each step sends and the replies it accepts
+MODES = {
+    "position": (MSG_POSITION, (MSG_CHUNK,)),
+    "stream": (MSG_STREAM, (MSG_CHUNK, MSG_DELTA)),
+    "tile": (MSG_TILE_REQUEST, (MSG_TILE,)),
+}
+
+# Window of cells around a player in tile mode, and the tile cache budget per player
+TILE_WINDOW = 25
+TILE_CACHE_BYTES = 64 * 1024
+
+# Wait after a failed connection before a player reconnects
+RECONNECT_DELAY = 0.5
+
+# Straight steps as (dx, dy)
+STEPS = [(0, -1), (1, 0), (0, 1), (-1, 0)]
+
+
+# Counters and histograms of one process; plain attributes so they pickle
+class LoadStats:
+    def __init__(self):
+        self.latency = {}  # request kind -> LatencyHistogram
+        self.counters = dict.fromkeys(
+            (
+                "connects",
+                "connect_errors",
+                "requests",
+                "replies",
+                "bytes_sent",
+                "bytes_received",
+                "timeouts",
+                "truncated",
+                "protocol_errors",
+                "connection_errors",
+            ),
+            0,
+        )
+
+    def record(self, kind, seconds):
+        self.latency.setdefault(kind, LatencyHistogram()).record(seconds)
+
+    def merge(self, other):
+        for key, value in other.counters.items():
+            self.counters[key] += value
+        for kind, histogram in other.latency.items():
+            self.latency.setdefault(kind, LatencyHistogram()).merge(histogram)
+
+
+# Error raised when a reply is cut short: the connection closed mid-frame or
+# the payload is shorter than its own header says
+class TruncatedReply(Exception):
+    pass
+
+
+# Function to read one frame from a stream; returns (message type, payload)
+async def read_frame(reader):
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+    except asyncio.IncompleteReadError as error:
+        if error.partial:
+            raise TruncatedReply("connection closed in the middle of a frame header")
+        raise ConnectionError("server closed the connection")
+    msg_type, _, length = FRAME_HEADER.unpack(header)
+    if length > MAX_PAYLOAD:
+        raise ValueError(f"frame payload of {length} bytes exceeds {MAX_PAYLOAD}")
+    try:
+        payload = await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        raise TruncatedReply("connection closed in the middle of a frame")
+    return msg_type, payload
+
+
+# Function to check that a CHUNK or TILE payload holds all the cells its header announces
+def check_chunk(payload):
+    if len(payload) < CHUNK_HEADER.size:
+        raise TruncatedReply("chunk payload shorter than its header")
+    _, _, height, width = CHUNK_HEADER.unpack_from(payload)
+    if len(payload) != CHUNK_HEADER.size + height * width:
+        raise TruncatedReply(f"chunk of {height}x{width} cells in {len(payload)} bytes")
+
+
+# Function to check whether a straight step leaves (x, y) for (x + dx, y + dy),
+# with the same rules as the server's pathfinding: diagonal walls cannot be
+# entered, horizontal and vertical walls block their cell's top and left edges.
+# cells holds the known window starting at world cell (origin_x, origin_y)
+def can_step(cells, origin_x, origin_y, x, y, dx, dy):
+    height, width = cells.shape
+    col, row = x + dx - origin_x, y + dy - origin_y
+    if not (0 <= col < width and 0 <= row < height):
+        return False
+    target = cells[row, col]
+    if target == SLASH_FORWARD_WALL or target == SLASH_BACKWARD_WALL:
+        return False
+    if dy:
+        # The crossed edge is the top edge of the lower cell
+        lower = target if dy > 0 else cells[row + 1, col]
+        return lower != HORIZONTAL_WALL
+    right = target if dx > 0 else cells[row, col + 1]
+    return right != VERTICAL_WALL
+
+
+# Simulated player: walks the part of the maze it has received, either at
+# random or along paths to random cells of that part
+class Player:
+    def __init__(self, rng, movement, position):
+        self.rng = rng
+        self.movement = movement
+        self.x, self.y = position
+        self.cells = None  # known window and its world origin
+        self.origin = (0, 0)
+        self.path = []  # remaining (x, y) cells to follow
+
+    # Function to take one step; returns whether the player moved
+    def step(self):
+        if self.cells is None:
+            return False
+        if self.movement == "path":
+            return self.follow_path()
+        steps = [
+            (dx, dy)
+            for dx, dy in STEPS
+            if can_step(self.cells, *self.origin, self.x, self.y, dx, dy)
+        ]
+        if not steps:
+            return False
+        dx, dy = self.rng.choice(steps)
+        self.x, self.y = self.x + dx, self.y + dy
+        return True
+
+    def follow_path(self):
+        if not self.path:
+            self.plan_path()
+        if not self.path:
+            return False
+        next_x, next_y = self.path.pop(0)
+        if not can_step(self.cells, *self.origin, self.x, self.y, next_x - self.x, next_y - self.y):
+            self.path = []  # the known window changed under the path
+            return False
+        self.x, self.y = next_x, next_y
+        return True
+
+    # Plan a path inside the known window to one of its random open cells
+    def plan_path(self):
+        origin_x, origin_y = self.origin
+        open_rows, open_cols = np.nonzero(self.cells == NO_WALL)
+        if not len(open_rows):
+            return
+        pick = self.rng.randrange(len(open_rows))
+        goal = (int(open_cols[pick]), int(open_rows[pick]))
+        path = PathFinder(self.cells).find_path((self.x - origin_x, self.y - origin_y), goal)
+        self.path = [(x + origin_x, y + origin_y) for x, y in path[1:]]
+
+
+# Function to run one player until the deadline, reconnecting after failures
+async def run_player(player_id, args, stats, deadline):
+    rng = random.Random(f"{args.seed}:{player_id}")
+    request_type, reply_types = MODES[args.mode]
+    interval = 1 / args.rate if args.rate > 0 else 0
+
+    while time.monotonic() < deadline:
+        writer = None
+        try:
+            # Connecting includes receiving the spawn point
+            started = time.perf_counter()
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(args.host, args.port), args.timeout
+            )
+            msg_type, payload = await asyncio.wait_for(read_frame(reader), args.timeout)
+            if msg_type != MSG_SPAWN:
+                raise ValueError(f"expected message type {MSG_SPAWN}, got {msg_type}")
+            stats.record("connect", time.perf_counter() - started)
+            stats.counters["connects"] += 1
+            stats.counters["bytes_received"] += FRAME_HEADER.size + len(payload)
+
+            player = Player(rng, args.movement, decode_position(payload))
+            tiles = TileCache(TILE_SIZE, TILE_CACHE_BYTES) if args.mode == "tile" else None
+            moved = True
+            while time.monotonic() < deadline:
+                if args.mode == "tile":
+                    window = (
+                        player.x - TILE_WINDOW // 2,
+                        player.y - TILE_WINDOW // 2,
+                        player.x + TILE_WINDOW // 2 + 1,
+                        player.y + TILE_WINDOW // 2 + 1,
+                    )
+                    missing = tiles.missing(*window)
+                    if not missing:
+                        # Cells past the world edge cannot be entered
+                        player.cells = tiles.window(*window, fill=SLASH_FORWARD_WALL)
+                        player.origin = window[:2]
+                        if player.step():
+                            # Report the new cell as client.py does; there is no reply
+                            buffers = encode_position(MSG_CELL, player.x, player.y)
+                            writer.writelines(buffers)
+                            stats.counters["bytes_sent"] += sum(len(buffer) for buffer in buffers)
+                        await asyncio.sleep(interval * rng.uniform(0.5, 1.5))
+                        continue
+                    request = missing[0]
+                elif args.mode == "stream" and not moved:
+                    # An unchanged STREAM position gets no reply; wait and retry
+                    moved = player.step()
+                    await asyncio.sleep(interval * rng.uniform(0.5, 1.5))
+                    continue
+                else:
+                    request = (player.x, player.y)
+
+                buffers = encode_position(request_type, *request)
+                started = time.perf_counter()
+                writer.writelines(buffers)
+                stats.counters["requests"] += 1
+                stats.counters["bytes_sent"] += sum(len(buffer) for buffer in buffers)
+                msg_type, payload = await asyncio.wait_for(read_frame(reader), args.timeout)
+                stats.record(args.mode, time.perf_counter() - started)
+                stats.counters["replies"] += 1
+                stats.counters["bytes_received"] += FRAME_HEADER.size + len(payload)
+                if msg_type not in reply_types:
+                    raise ValueError(f"unexpected message type {msg_type}")
+
+                if msg_type == MSG_DELTA:
+                    origin_x, origin_y, cells = apply_delta(*player.origin, player.cells, payload)
+                    player.origin, player.cells = (origin_x, origin_y), cells
+                else:
+                    check_chunk(payload)
+                    origin_x, origin_y, cells = decode_chunk(payload)
+                    if msg_type == MSG_TILE:
+                        tiles.put((origin_x // TILE_SIZE, origin_y // TILE_SIZE), cells)
+                        continue
+                    player.origin, player.cells = (origin_x, origin_y), cells
+
+                moved = player.step()
+                await asyncio.sleep(interval * rng.uniform(0.5, 1.5))
+        except asyncio.TimeoutError:
+            stats.counters["timeouts"] += 1
+        except TruncatedReply:
+            stats.counters["truncated"] += 1
+        except ValueError:
+            stats.counters["protocol_errors"] += 1
+        except OSError:
+            key = "connection_errors" if writer is not None else "connect_errors"
+            stats.counters[key] += 1
+        finally:
+            if writer is not None:
+                writer.close()
+        if time.monotonic() < deadline:
+            await asyncio.sleep(RECONNECT_DELAY)
+
+
+# Function to run a group of players in one event loop, starting them evenly
+# over the ramp-up time; returns the LoadStats of the group
+async def run_players(first_id, count, args):
+    stats = LoadStats()
+    started = time.monotonic()
+    deadline = started + args.ramp + args.duration
+
+    async def start(player_id, delay):
+        await asyncio.sleep(delay)
+        await run_player(player_id, args, stats, deadline)
+
+    await asyncio.gather(
+        *(start(first_id + index, args.ramp * index / max(count, 1)) for index in range(count))
+    )
+    return stats
+
+
+# Function run in each worker process; raises the open file limit so thousands
+# of connections fit in one process
+def worker(first_id, count, args, results):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    results.put(asyncio.run(run_players(first_id, count, args)))
+
+
+# Function to run the whole load test; returns the merged LoadStats and the wall time
+def run_load(args):
+    processes = max(min(args.processes, args.players), 1)
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    workers = []
+    first_id = 0
+    for index in range(processes):
+        count = args.players // processes + (index < args.players % processes)
+        workers.append(context.Process(target=worker, args=(first_id, count, args, results)))
+        first_id += count
+
+    started = time.monotonic()
+    for process in workers:
+        process.start()
+    stats = LoadStats()
+    for _ in workers:
+        stats.merge(results.get())
+    for process in workers:
+        process.join()
+    return stats, time.monotonic() - started
+
+
+# Function to summarize a load test for printing and JSON output
+def report(stats, elapsed, args):
+    counters = stats.counters
+    attempts = counters["connects"] + counters["connect_errors"]
+    failures = counters["timeouts"] + counters["protocol_errors"] + counters["connection_errors"]
+    return {
+        "players": args.players,
+        "processes": args.processes,
+        "mode": args.mode,
+        "movement": args.movement,
+        "elapsed_s": elapsed,
+        "throughput_rps": counters["replies"] / elapsed if elapsed else 0.0,
+        "received_mbps": counters["bytes_received"] * 8 / 1e6 / elapsed if elapsed else 0.0,
+        "error_rate": (failures + counters["truncated"]) / max(counters["requests"], 1),
+        "truncation_rate": counters["truncated"] / max(counters["requests"], 1),
+        "connect_error_rate": counters["connect_errors"] / max(attempts, 1),
+        "counters": counters,
+        "latency": {kind: histogram.summary() for kind, histogram in stats.latency.items()},
+    }
+
+
+# Function to print a report
+def print_report(summary):
+    print(
+        f"{summary['players']} players in {summary['processes']} processes, "
+        f"{summary['mode']} requests, {summary['movement']} movement, {summary['elapsed_s']:.1f} s"
+    )
+    print(
+        f"throughput {summary['throughput_rps']:.1f} replies/s, received {summary['received_mbps']:.2f} Mbit/s"
+    )
+    print(
+        f"errors {summary['error_rate']:.2%} of requests (truncated {summary['truncation_rate']:.2%}), "
+        f"connect errors {summary['connect_error_rate']:.2%} of attempts"
+    )
+    print("counters: " + ", ".join(f"{key} {value}" for key, value in summary["counters"].items()))
+    print(f"\n{'latency':<12}{'count':>10}{'mean':>10}{'p50':>10}{'p90':>10}{'p99':>10}{'p99.9':>10}{'max':>10}")
+    for kind, latency in summary["latency"].items():
+        print(
+            f"{kind:<12}{latency['count']:>10}{latency['mean_ms']:>8.2f}ms{latency['p50_ms']:>8.2f}ms"
+            f"{latency['p90_ms']:>8.2f}ms{latency['p99_ms']:>8.2f}ms{latency['p999_ms']:>8.2f}ms"
+            f"{latency['max_ms']:>8.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless load generator for the maze server")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--players", type=int, default=100, help="number of simulated players")
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help="processes the players are spread over, each with its own event loop",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=sorted(MODES),
+        default="position",
+        help="full chunks per position, streamed window deltas, or tile requests",
+    )
+    parser.add_argument(
+        "--movement",
+        choices=["random", "path"],
+        default="random",
+        help="random walk, or following paths to random cells of the known window",
+    )
+    parser.add_argument("--rate", type=float, default=10.0, help="requests per second per player")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of load after ramp-up")
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which players connect")
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds to wait for a reply")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the players' movement")
+    parser.add_argument("--json", help="also write the report as JSON to this file")
+    args = parser.parse_args()
+
+    stats, elapsed = run_load(args)
+    summary = report(stats, elapsed, args)
+    print_report(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
@@ -0,0 +1,264 @@
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Low-overhead instrumentation. Every thread records into its own buffer of
+# counters and latency histograms, so recording never takes a lock; a snapshot
+# merges the buffers of all threads. When a thread is done (a connection of the
+# thread-per-connection server closes) its buffer is folded into a retired
+# total, so buffers do not pile up.
+#
+# Latency histogram: log-spaced buckets, HISTOGRAM_SUB_BUCKETS per doubling of
+# the latency in microseconds, so percentiles are within about 4%
+HISTOGRAM_SUB_BUCKETS = 16
+
+# Sampling profiler: seconds between samples and innermost frames kept per stack
+PROFILE_INTERVAL = 0.005
+PROFILE_DEPTH = 8
+
+# Entries listed per table in a profile snapshot
+PROFILE_TOP = 20
+
+
+# Latency histogram with a bounded relative error, cheap to record into and to
+# merge across threads and processes. Buckets are only stored once used
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = {}  # bucket -> samples
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        bucket = int(math.log2(max(seconds * 1e6, 1.0)) * HISTOGRAM_SUB_BUCKETS)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.total += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        for bucket, count in list(other.counts.items()):
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.total += other.total
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    # Latency in seconds below which a fraction q of the samples fall (the upper
+    # edge of the bucket holding that sample)
+    def percentile(self, q):
+        if not self.total:
+            return 0.0
+        rank = max(math.ceil(q * self.total), 1)
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return min(2 ** ((bucket + 1) / HISTOGRAM_SUB_BUCKETS) / 1e6, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.total,
+            "mean_ms": self.sum / self.total * 1000 if self.total else 0.0,
+            "p50_ms": self.percentile(0.50) * 1000,
+            "p90_ms": self.percentile(0.90) * 1000,
+            "p99_ms": self.percentile(0.99) * 1000,
+            "p999_ms": self.percentile(0.999) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+
+# Counters and histograms recorded by one thread
+class MetricsBuffer:
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def merge(self, other):
+        for name, value in list(other.counters.items()):
+            self.counters[name] = self.counters.get(name, 0) + value
+        for name, histogram in list(other.histograms.items()):
+            self.histograms.setdefault(name, LatencyHistogram()).merge(histogram)
+
+
+# Registry of the per-thread buffers of a process, with the startup phase timings
+class Metrics:
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()  # taken when threads come and go, and by snapshots
+        self.buffers = []
+        self.retired = MetricsBuffer()
+        self.phases = {}  # startup phase -> seconds, in order
+        self.started = time.time()
+
+    # Buffer of the calling thread, registered on first use
+    def buffer(self):
+        buffer = getattr(self.local, "buffer", None)
+        if buffer is None:
+            buffer = self.local.buffer = MetricsBuffer()
+            with self.lock:
+                self.buffers.append(buffer)
+        return buffer
+
+    def count(self, name, value=1):
+        counters = self.buffer().counters
+        counters[name] = counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        histograms = self.buffer().histograms
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = LatencyHistogram()
+        histogram.record(seconds)
+
+    # Fold the calling thread's buffer into the retired total; for threads
+    # that are about to exit
+    def retire(self):
+        buffer = getattr(self.local, "buffer", None)
+        if buffer is None:
+            return
+        with self.lock:
+            self.buffers.remove(buffer)
+            self.retired.merge(buffer)
+        del self.local.buffer
+
+    # Context manager timing a startup phase, recorded if it completes; phases
+    # run once, so this is not meant for hot paths
+    def phase(self, name):
+        return PhaseTimer(self, name)
+
+    # Function to merge every thread's buffer. Other threads keep recording while
+    # this runs, so a snapshot may miss their very latest samples; their dicts
+    # are copied with list(), which does not let them change halfway
+    def merged(self):
+        with self.lock:
+            buffers = [self.retired, *self.buffers]
+            total = MetricsBuffer()
+            for buffer in buffers:
+                total.merge(buffer)
+        return total
+
+    # Function to take a snapshot of all metrics as a JSON-ready dict
+    def snapshot(self, profiler=None):
+        total = self.merged()
+        uptime = time.time() - self.started
+        counters = dict(sorted(total.counters.items()))
+        snapshot = {
+            "pid": os.getpid(),
+            "time": time.time(),
+            "uptime_s": uptime,
+            "startup_s": dict(self.phases),
+            "counters": counters,
+            "rates_per_s": {name: value / uptime for name, value in counters.items()} if uptime else {},
+            "latency": {
+                name: histogram.summary() for name, histogram in sorted(total.histograms.items())
+            },
+        }
+        if profiler is not None:
+            snapshot["profile"] = profiler.snapshot()
+        return snapshot
+
+
+class PhaseTimer:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.metrics.phases[self.name] = time.perf_counter() - self.started
+        return False
+
+
+# Sampling profiler: a background thread that looks at the stack of every other
+# thread at a fixed interval and counts the innermost frames it sees. Costs
+# nothing while stopped; while running, one short pause per interval
+class SamplingProfiler:
+    def __init__(self, interval=PROFILE_INTERVAL, depth=PROFILE_DEPTH):
+        self.interval = interval
+        self.depth = depth
+        self.stacks = Counter()  # innermost-first tuple of frames -> samples
+        self.functions = Counter()  # innermost frame -> samples
+        self.samples = 0
+        self.lock = threading.Lock()  # between the sampling thread and snapshots
+        self.thread = None
+        self.running = threading.Event()
+
+    @property
+    def active(self):
+        return self.running.is_set()
+
+    def start(self):
+        if self.active:
+            return
+        if self.thread is not None:
+            self.thread.join()  # a stopped sampler finishes its last interval
+        self.running.set()
+        self.thread = threading.Thread(target=self.run, name="sampling-profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running.clear()
+
+    # Start when stopped and stop when running; returns whether it now runs
+    def toggle(self):
+        if self.active:
+            self.stop()
+        else:
+            self.start()
+        return self.active
+
+    def run(self):
+        own = threading.get_ident()
+        while self.running.is_set():
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.depth:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{frame.f_lineno} {code.co_name}")
+                    frame = frame.f_back
+                if stack:
+                    with self.lock:
+                        self.stacks[tuple(stack)] += 1
+                        self.functions[stack[0]] += 1
+                        self.samples += 1
+            time.sleep(self.interval)
+
+    def snapshot(self, top=PROFILE_TOP):
+        with self.lock:
+            return self.tables(top)
+
+    def tables(self, top):
+        samples = max(self.samples, 1)
+        return {
+            "active": self.active,
+            "samples": self.samples,
+            "functions": [
+                {"frame": frame, "share": count / samples}
+                for frame, count in self.functions.most_common(top)
+            ],
+            "stacks": [
+                {"stack": list(stack), "share": count / samples}
+                for stack, count in self.stacks.most_common(top)
+            ],
+        }
+
+
+# Function to write a snapshot as JSON; the file is replaced atomically so a
+# reader never sees half a snapshot
+def write_snapshot(path, snapshot):
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump(snapshot, f, indent=2)
+    os.replace(tmp_path, path)
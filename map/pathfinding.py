@@ -0,0 +1,561 @@
+from collections import OrderedDict
+from heapq import heappop, heappush
+import math
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from worldgen import (
+    HORIZONTAL_WALL,
+    VERTICAL_WALL,
+    SLASH_FORWARD_WALL,
+    SLASH_BACKWARD_WALL,
+)
+
+# Movement model on the server's maze encoding. A horizontal wall lies on the top
+# edge of its cell and a vertical wall on its left edge, so they block moving
+# across that edge only. A diagonal wall cuts its cell in two, so those cells
+# cannot be entered at all. Diagonal moves need both orthogonal routes around
+# the corner to be open, so paths never squeeze past a wall end.
+#
+# Direction bits of the per-cell move mask, with their (dx, dy) step
+NORTH, EAST, SOUTH, WEST = 1, 2, 4, 8
+NORTH_EAST, SOUTH_EAST, SOUTH_WEST, NORTH_WEST = 16, 32, 64, 128
+STRAIGHT_MOVES = [(NORTH, 0, -1), (EAST, 1, 0), (SOUTH, 0, 1), (WEST, -1, 0)]
+DIAGONAL_MOVES = [
+    (NORTH_EAST, 1, -1),
+    (SOUTH_EAST, 1, 1),
+    (SOUTH_WEST, -1, 1),
+    (NORTH_WEST, -1, -1),
+]
+
+SQRT2 = math.sqrt(2)
+
+
+# Function to compute, for every cell, the bit mask of the moves allowed out of it
+def passable_moves(maze):
+    maze = np.asarray(maze)
+    height, width = maze.shape
+    open_cell = (maze != SLASH_FORWARD_WALL) & (maze != SLASH_BACKWARD_WALL)
+    moves = np.zeros((height, width), dtype=np.uint8)
+
+    # Straight moves: both cells open and no wall on the shared edge
+    north = np.zeros((height, width), dtype=bool)
+    north[1:] = open_cell[1:] & open_cell[:-1] & (maze[1:] != HORIZONTAL_WALL)
+    west = np.zeros((height, width), dtype=bool)
+    west[:, 1:] = open_cell[:, 1:] & open_cell[:, :-1] & (maze[:, 1:] != VERTICAL_WALL)
+    south = np.zeros((height, width), dtype=bool)
+    south[:-1] = north[1:]
+    east = np.zeros((height, width), dtype=bool)
+    east[:, :-1] = west[:, 1:]
+
+    # Diagonal moves: both ways around the corner must be open
+    north_east = np.zeros((height, width), dtype=bool)
+    north_east[1:, :-1] = (
+        north[1:, :-1] & east[:-1, :-1] & east[1:, :-1] & north[1:, 1:]
+    )
+    north_west = np.zeros((height, width), dtype=bool)
+    north_west[1:, 1:] = north[1:, 1:] & west[:-1, 1:] & west[1:, 1:] & north[1:, :-1]
+    south_east = np.zeros((height, width), dtype=bool)
+    south_east[:-1, :-1] = north_west[1:, 1:]
+    south_west = np.zeros((height, width), dtype=bool)
+    south_west[:-1, 1:] = north_east[1:, :-1]
+
+    for bit, allowed in (
+        (NORTH, north),
+        (EAST, east),
+        (SOUTH, south),
+        (WEST, west),
+        (NORTH_EAST, north_east),
+        (SOUTH_EAST, south_east),
+        (SOUTH_WEST, south_west),
+        (NORTH_WEST, north_west),
+    ):
+        moves[allowed] |= bit
+    return moves
+
+
+# Function to build the sparse graph of the moves in a move mask, with cells as
+# row-major node indices; moves leaving the mask are left out
+def move_graph(moves, diagonal=False):
+    height, width = moves.shape
+    index = np.arange(height * width).reshape(height, width)
+    steps = [(bit, dx, dy, 1.0) for bit, dx, dy in STRAIGHT_MOVES]
+    if diagonal:
+        steps += [(bit, dx, dy, SQRT2) for bit, dx, dy in DIAGONAL_MOVES]
+    sources, targets, costs = [], [], []
+    for bit, dx, dy, cost in steps:
+        rows = slice(max(-dy, 0), height - max(dy, 0))
+        cols = slice(max(-dx, 0), width - max(dx, 0))
+        allowed = (moves[rows, cols] & bit) != 0
+        source = index[rows, cols][allowed]
+        sources.append(source)
+        targets.append(source + dy * width + dx)
+        costs.append(np.full(source.size, cost))
+    return csr_matrix(
+        (np.concatenate(costs), (np.concatenate(sources), np.concatenate(targets))),
+        shape=(height * width, height * width),
+    )
+
+
+# Function to find, along the last axis, the index of the first flagged entry at
+# or after each position (forward) or at or before it (backward); missing is
+# len or -1
+def first_flagged(flags, forward):
+    length = flags.shape[-1]
+    positions = np.arange(length)
+    if forward:
+        index = np.where(flags, positions, length)
+        return np.minimum.accumulate(index[..., ::-1], axis=-1)[..., ::-1]
+    return np.maximum.accumulate(np.where(flags, positions, -1), axis=-1)
+
+
+# Function to compute the straight jumps along the last axis: for every cell, the
+# last cell a straight run can reach and the first jump point after it within
+# that run (-1 if none), as positions on the axis
+def line_jumps(can_move, jump_points, forward):
+    length = can_move.shape[-1]
+    reach = first_flagged(~can_move, forward)
+    after = np.full(can_move.shape, length if forward else -1, dtype=np.intp)
+    if forward:
+        after[..., :-1] = first_flagged(jump_points, True)[..., 1:]
+        stop = np.where(after <= reach, after, -1)
+    else:
+        after[..., 1:] = first_flagged(jump_points, False)[..., :-1]
+        stop = np.where(after >= reach, after, -1)
+    return reach, stop
+
+
+# Function to precompute the straight-move jumps of Jump Point Search for a move
+# mask; returns {direction bit: (reach, stop)} as flat cell index arrays. A cell
+# is a jump point of a horizontal run if it can move vertically where the cell
+# before it could not have moved vertically first. A cell is a jump point of a
+# vertical run if the same holds for horizontal moves, or if a horizontal jump
+# from it finds a jump point
+def jump_tables(moves):
+    height, width = moves.shape
+    padded = np.zeros((height + 2, width + 2), dtype=moves.dtype)
+    padded[1:-1, 1:-1] = moves
+
+    # has(bit, dy, dx)[y, x]: whether cell (x + dx, y + dy) allows the move
+    def has(bit, dy=0, dx=0):
+        return (padded[1 + dy : height + 1 + dy, 1 + dx : width + 1 + dx] & bit) != 0
+
+    forced = {
+        EAST: (has(NORTH) & ~(has(NORTH, 0, -1) & has(EAST, -1, -1)))
+        | (has(SOUTH) & ~(has(SOUTH, 0, -1) & has(EAST, 1, -1))),
+        WEST: (has(NORTH) & ~(has(NORTH, 0, 1) & has(WEST, -1, 1)))
+        | (has(SOUTH) & ~(has(SOUTH, 0, 1) & has(WEST, 1, 1))),
+        SOUTH: (has(EAST) & ~(has(EAST, -1, 0) & has(SOUTH, -1, 1)))
+        | (has(WEST) & ~(has(WEST, -1, 0) & has(SOUTH, -1, -1))),
+        NORTH: (has(EAST) & ~(has(EAST, 1, 0) & has(NORTH, 1, 1)))
+        | (has(WEST) & ~(has(WEST, 1, 0) & has(NORTH, 1, -1))),
+    }
+    rows = np.arange(height)[:, np.newaxis] * width
+    columns = np.arange(width)[np.newaxis, :]
+
+    tables = {}
+    for bit, forward in ((EAST, True), (WEST, False)):
+        reach, stop = line_jumps(has(bit), forced[bit], forward)
+        tables[bit] = (rows + reach, np.where(stop == -1, -1, rows + stop))
+    horizontal = (tables[EAST][1] != -1) | (tables[WEST][1] != -1)
+    for bit, forward in ((SOUTH, True), (NORTH, False)):
+        reach, stop = line_jumps(has(bit).T, (forced[bit] | horizontal).T, forward)
+        reach, stop = reach.T, stop.T
+        tables[bit] = (reach * width + columns, np.where(stop == -1, -1, stop * width + columns))
+    return {
+        bit: tuple(table.ravel().astype(np.int32) for table in pair)
+        for bit, pair in tables.items()
+    }
+
+
+# A* over the maze on flat cell indices (y * width + x). The cost, parent and
+# closed-set arrays are allocated once and reused by every query: each query
+# bumps a generation number, and an entry only counts if its stamp matches the
+# current generation, so nothing has to be cleared between queries. Not safe to
+# share between threads without a lock
+class PathFinder:
+    def __init__(self, maze, diagonal=False, max_fields=8):
+        self.height, self.width = np.shape(maze)
+        self.diagonal = diagonal
+        size = self.height * self.width
+        self.moves = passable_moves(maze).ravel()
+        self.cost = np.zeros(size, dtype=np.float64)
+        self.parent = np.zeros(size, dtype=np.int64)
+        self.seen = np.zeros(size, dtype=np.uint32)  # generation cost/parent were set
+        self.closed = np.zeros(size, dtype=np.uint32)  # generation the cell was expanded
+        self.generation = 0
+        self.version = 0  # bumped on every maze update, for cached paths
+        self.jumps = None  # jump tables for find_jump_path, built on first use
+        self.jumps_version = None
+        self.graphs = {}  # diagonal -> move graph for distance fields, built on first use
+        self.fields = OrderedDict()  # recently computed distance fields
+        self.max_fields = max_fields
+
+    # Recompute the allowed moves for a rectangle of cells after the maze changed
+    def update(self, maze, min_x, min_y, max_x, max_y):
+        # Moves out of the cells around the rectangle can change as well
+        min_x, min_y = max(min_x - 1, 0), max(min_y - 1, 0)
+        max_x, max_y = min(max_x + 1, self.width), min(max_y + 1, self.height)
+        pad_x0, pad_y0 = max(min_x - 1, 0), max(min_y - 1, 0)
+        pad_x1, pad_y1 = min(max_x + 1, self.width), min(max_y + 1, self.height)
+        region = passable_moves(np.asarray(maze)[pad_y0:pad_y1, pad_x0:pad_x1])
+        moves = self.moves.reshape(self.height, self.width)
+        moves[min_y:max_y, min_x:max_x] = region[
+            min_y - pad_y0 : max_y - pad_y0, min_x - pad_x0 : max_x - pad_x0
+        ]
+        self.version += 1
+        self.graphs.clear()
+        self.fields.clear()
+
+    # Start a new query generation, clearing the stamps when the counter wraps
+    def next_generation(self):
+        self.generation += 1
+        if self.generation == np.iinfo(np.uint32).max:
+            self.seen[:] = 0
+            self.closed[:] = 0
+            self.generation = 1
+        return self.generation
+
+    # Neighbour steps as (direction bit, flat index offset, cost)
+    def steps(self, diagonal):
+        steps = [(bit, dy * self.width + dx, 1.0) for bit, dx, dy in STRAIGHT_MOVES]
+        if diagonal:
+            steps += [(bit, dy * self.width + dx, SQRT2) for bit, dx, dy in DIAGONAL_MOVES]
+        return steps
+
+    # Function to find the shortest path between two (x, y) cells; returns the list
+    # of cells from start to goal, or an empty list if the goal is unreachable.
+    # The search runs in the interpreter and its cost grows with the area it
+    # explores: on the 1000x1000 world a query over up to a hundred cells or so
+    # takes a few milliseconds, one across the map 100-1000 ms. Long routes are
+    # for HierarchicalPathFinder (the server's find_route), tens of milliseconds
+    def find_path(self, start, goal, diagonal=None):
+        if diagonal is None:
+            diagonal = self.diagonal
+        width = self.width
+        for x, y in (start, goal):
+            if not (0 <= x < width and 0 <= y < self.height):
+                return []
+        source = start[1] * width + start[0]
+        target = goal[1] * width + goal[0]
+        if source == target:
+            return [tuple(start)]
+        # A cell without moves (a diagonal wall, or walled in) cannot be on a
+        # path; without this check the search would explore the whole region
+        if not self.moves[source] or not self.moves[target]:
+            return []
+        goal_x, goal_y = goal
+        generation = self.next_generation()
+        steps = self.steps(diagonal)
+
+        # Scalar access through memoryviews is much faster than NumPy indexing
+        moves = memoryview(self.moves)
+        cost = memoryview(self.cost)
+        parent = memoryview(self.parent)
+        seen = memoryview(self.seen)
+        closed = memoryview(self.closed)
+
+        cost[source] = 0.0
+        parent[source] = -1
+        seen[source] = generation
+        # Entries are (estimated total, -cost, cell): ties go to the deeper cell
+        frontier = [(0.0, 0.0, source)]
+        while frontier:
+            _, current_cost, current = heappop(frontier)
+            current_cost = -current_cost
+            if closed[current] == generation:
+                continue  # stale entry for a cell already expanded at a lower cost
+            if current == target:
+                break
+            closed[current] = generation
+
+            allowed = moves[current]
+            for bit, offset, step_cost in steps:
+                if not allowed & bit:
+                    continue
+                neighbor = current + offset
+                if closed[neighbor] == generation:
+                    continue
+                new_cost = current_cost + step_cost
+                if seen[neighbor] != generation or new_cost < cost[neighbor]:
+                    seen[neighbor] = generation
+                    cost[neighbor] = new_cost
+                    parent[neighbor] = current
+                    dx = abs(neighbor % width - goal_x)
+                    dy = abs(neighbor // width - goal_y)
+                    if diagonal:
+                        estimate = dx + dy + (SQRT2 - 2) * min(dx, dy)
+                    else:
+                        estimate = dx + dy
+                    heappush(frontier, (new_cost + estimate, -new_cost, neighbor))
+        else:
+            return []  # If there's no valid path, return an empty list
+
+        # Reconstruct path
+        path = []
+        current = target
+        while current != -1:
+            path.append((current % width, current // width))
+            current = parent[current]
+        path.reverse()
+        return path
+
+    # Jump Point Search for straight (4-connected) moves. Every move costs the
+    # same, so many shortest paths are equivalent; the search only follows the
+    # one that makes its vertical moves as early as possible. A jump runs in a
+    # straight line and stops only at the goal or at a jump point, so only jump
+    # points go on the heap, which pays off in open regions. On the generated
+    # maze, walls are so dense that jumps stay short and this is no faster than
+    # find_path (see the find_jump_path benchmark), so the server uses it only on
+    # request. The jumps are looked up in precomputed tables (see jump_tables),
+    # rebuilt after an update
+    def jump_tables(self):
+        if self.jumps is None or self.jumps_version != self.version:
+            tables = jump_tables(self.moves.reshape(self.height, self.width))
+            self.jumps = {bit: tuple(map(memoryview, table)) for bit, table in tables.items()}
+            self.jumps_version = self.version
+        return self.jumps
+
+    # Function to jump from a cell in a straight direction; returns the jump point
+    # reached, the target if it is passed on the way, or -1
+    def jump(self, jumps, cell, bit, target, goal_y):
+        width = self.width
+        reach, stop = jumps[bit]
+        limit = stop[cell] if stop[cell] != -1 else reach[cell]
+        if bit == EAST:
+            return target if cell < target <= limit and target // width == cell // width else stop[cell]
+        if bit == WEST:
+            return target if limit <= target < cell and target // width == cell // width else stop[cell]
+
+        # Vertical jumps also stop on the goal's row if a horizontal jump reaches it
+        if min(cell, limit) <= target <= max(cell, limit) and target % width == cell % width:
+            return target
+        # The rows passed on the way exclude the row of the current cell itself
+        if bit == SOUTH:
+            passes_goal_row = cell // width < goal_y <= limit // width
+        else:
+            passes_goal_row = limit // width <= goal_y < cell // width
+        if passes_goal_row:
+            row = goal_y * width + cell % width
+            for side in (EAST, WEST):
+                side_reach, side_stop = jumps[side]
+                end = side_stop[row] if side_stop[row] != -1 else side_reach[row]
+                if min(row, end) <= target <= max(row, end):
+                    return row
+        return stop[cell]
+
+    # Function to find the shortest straight-move path between two (x, y) cells
+    # with Jump Point Search; same result format as find_path
+    def find_jump_path(self, start, goal):
+        width = self.width
+        for x, y in (start, goal):
+            if not (0 <= x < width and 0 <= y < self.height):
+                return []
+        source = start[1] * width + start[0]
+        target = goal[1] * width + goal[0]
+        goal_x, goal_y = goal
+        generation = self.next_generation()
+        jumps = self.jump_tables()
+
+        cost = memoryview(self.cost)
+        parent = memoryview(self.parent)
+        seen = memoryview(self.seen)
+        closed = memoryview(self.closed)
+
+        cost[source] = 0.0
+        parent[source] = -1
+        seen[source] = generation
+        frontier = [(0.0, 0.0, source)]
+        while frontier:
+            _, current_cost, current = heappop(frontier)
+            current_cost = -current_cost
+            if closed[current] == generation:
+                continue
+            if current == target:
+                break
+            closed[current] = generation
+
+            # Directions worth following from here, given how the cell was reached
+            previous = parent[current]
+            if previous == -1:
+                directions = (EAST, WEST, SOUTH, NORTH)
+            elif abs(current - previous) < width:
+                directions = (EAST if current > previous else WEST, SOUTH, NORTH)
+            else:
+                directions = (SOUTH if current > previous else NORTH, EAST, WEST)
+
+            for bit in directions:
+                jump = self.jump(jumps, current, bit, target, goal_y)
+                if jump == -1 or closed[jump] == generation:
+                    continue
+                new_cost = current_cost + abs(jump % width - current % width) + abs(
+                    jump // width - current // width
+                )
+                if seen[jump] != generation or new_cost < cost[jump]:
+                    seen[jump] = generation
+                    cost[jump] = new_cost
+                    parent[jump] = current
+                    estimate = abs(jump % width - goal_x) + abs(jump // width - goal_y)
+                    heappush(frontier, (new_cost + estimate, -new_cost, jump))
+        else:
+            return []
+
+        # Reconstruct path, filling in the straight runs between jump points
+        path = [(goal_x, goal_y)]
+        current = target
+        while parent[current] != -1:
+            previous = parent[current]
+            x, y = current % width, current // width
+            px, py = previous % width, previous // width
+            step_x = (px > x) - (px < x)
+            step_y = (py > y) - (py < y)
+            while (x, y) != (px, py):
+                x += step_x
+                y += step_y
+                path.append((x, y))
+            current = previous
+        path.reverse()
+        return path
+
+    # Function to compute the distance field to one or more (x, y) source cells:
+    # the cost of the shortest path from every cell to its nearest source, in one
+    # multi-source Dijkstra pass. Any number of agents can then walk to the
+    # sources with DistanceField.next_steps instead of one search each. Cells
+    # farther than limit are left unreachable. The most recent fields are cached
+    def distance_field(self, sources, diagonal=None, limit=np.inf):
+        if diagonal is None:
+            diagonal = self.diagonal
+        sources = tuple(sorted({(int(x), int(y)) for x, y in sources}))
+        key = (sources, diagonal, limit)
+        field = self.fields.get(key)
+        if field is not None:
+            self.fields.move_to_end(key)
+            return field
+
+        graph = self.graphs.get(diagonal)
+        if graph is None:
+            graph = move_graph(self.moves.reshape(self.height, self.width), diagonal)
+            self.graphs[diagonal] = graph
+        indices = [
+            y * self.width + x
+            for x, y in sources
+            if 0 <= x < self.width and 0 <= y < self.height
+        ]
+        if indices:
+            distances = dijkstra(graph, indices=indices, min_only=True, limit=limit)
+        else:
+            distances = np.full(self.height * self.width, np.inf)
+        field = DistanceField(
+            distances.astype(np.float32).reshape(self.height, self.width),
+            self.moves.reshape(self.height, self.width),
+            diagonal,
+        )
+        self.fields[key] = field
+        while len(self.fields) > self.max_fields:
+            self.fields.popitem(last=False)
+        return field
+
+
+# Distances from every cell to the nearest source of a distance field (inf where
+# unreachable), with vectorized steps for moving agents towards the sources along
+# shortest paths
+class DistanceField:
+    def __init__(self, distances, moves, diagonal=False):
+        self.distances = distances
+        self.moves = moves
+        self.height, self.width = distances.shape
+        self.steps = [(bit, dx, dy, 1.0) for bit, dx, dy in STRAIGHT_MOVES]
+        if diagonal:
+            self.steps += [(bit, dx, dy, SQRT2) for bit, dx, dy in DIAGONAL_MOVES]
+
+    # Distance of an (x, y) cell to the nearest source
+    def distance(self, cell):
+        x, y = cell
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return math.inf
+        return float(self.distances[y, x])
+
+    # Function to move many agents one step towards the nearest source at once;
+    # takes and returns arrays of x and y cells. Each agent takes the step that
+    # minimizes the step cost plus the distance left, which is a step along a
+    # shortest path (the neighbour with the lowest distance may not be, once
+    # diagonal steps cost more). Agents on a source, or with no way to a
+    # source, stay where they are
+    def next_steps(self, xs, ys):
+        xs = np.asarray(xs, dtype=np.intp)
+        ys = np.asarray(ys, dtype=np.intp)
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        x = np.where(inside, xs, 0)
+        y = np.where(inside, ys, 0)
+        allowed = self.moves[y, x]
+        here = np.where(inside, self.distances[y, x], np.inf)
+        best = np.full(here.shape, np.inf)
+        next_x, next_y = xs.copy(), ys.copy()
+        for bit, dx, dy, cost in self.steps:
+            # A set move bit guarantees the neighbour is on the grid
+            can_move = inside & ((allowed & bit) != 0)
+            distance = np.where(
+                can_move,
+                self.distances[np.where(can_move, y + dy, 0), np.where(can_move, x + dx, 0)],
+                np.inf,
+            )
+            # Only steps that get closer, so agents on a source stay put
+            total = distance + cost
+            better = (total < best) & (distance < here)
+            best = np.where(better, total, best)
+            next_x = np.where(better, xs + dx, next_x)
+            next_y = np.where(better, ys + dy, next_y)
+        return next_x, next_y
+
+    # Function to follow the field from an (x, y) cell to the nearest source;
+    # returns the list of cells, or an empty list if no source is reachable
+    def path(self, start):
+        if not math.isfinite(self.distance(start)):
+            return []
+        x, y = start
+        path = [(x, y)]
+        while self.distances[y, x] > 0:
+            next_x, next_y = self.next_steps([x], [y])
+            if (next_x[0], next_y[0]) == (x, y):
+                return []  # stuck: only possible with rounding on huge distances
+            x, y = int(next_x[0]), int(next_y[0])
+            path.append((x, y))
+        return path
+
+
+# Least-recently-used cache of found paths, keyed by (start cell, goal cell, map
+# version, search options). Moves are symmetric, so a cached path also answers
+# the reverse query. Entries of older map versions are dropped as soon as a query
+# for a newer version comes in
+class PathCache:
+    def __init__(self, max_paths=1024):
+        self.max_paths = max_paths
+        self.paths = OrderedDict()
+        self.version = None
+
+    # Get a cached path as a new list; None if it is not cached
+    def get(self, start, goal, version, options=()):
+        if version != self.version:
+            self.paths.clear()
+            self.version = version
+            return None
+        key = (tuple(start), tuple(goal), version, options)
+        path = self.paths.get(key)
+        if path is not None:
+            self.paths.move_to_end(key)
+            return list(path)
+        path = self.paths.get((tuple(goal), tuple(start), version, options))
+        if path is not None:
+            return list(reversed(path))
+        return None
+
+    # Store a path found for a query, evicting the least recently used paths over max_paths
+    def put(self, start, goal, version, path, options=()):
+        if version != self.version:
+            self.paths.clear()
+            self.version = version
+        key = (tuple(start), tuple(goal), version, options)
+        self.paths[key] = tuple(path)
+        self.paths.move_to_end(key)
+        while len(self.paths) > self.max_paths:
+            self.paths.popitem(last=False)
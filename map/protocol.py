@@ -0,0 +1,245 @@
+import struct
+import numpy as np
+
+# Wire protocol shared by the server and the client.
+#
+# Every message is a frame: a fixed 8-byte header followed by the payload.
+#   header:   message type (uint16) | reserved (uint16) | payload length (uint32)
+# Payloads, all little-endian:
+#   SPAWN     server -> client   x (int32) | y (int32)
+#   POSITION  client -> server   x (int32) | y (int32)
+#   CHUNK     server -> client   origin x (int32) | origin y (int32)
+#                                height (uint16) | width (uint16)
+#                                height * width raw uint8 cells, row-major
+#   STREAM    client -> server   x (int32) | y (int32), no reply expected
+#   DELTA     server -> client   CHUNK header of the new window | strip count (uint16)
+#                                then per strip: x | y (relative to the new origin)
+#                                height | width (all uint16), then its raw cells
+#   TILE_REQUEST client -> server  tile x (int32) | tile y (int32), in TILE_SIZE units
+#   TILE      server -> client   same payload as CHUNK; the origin is the tile
+#                                origin and tiles on the world edge are smaller
+#   CELL      client -> server   x (int32) | y (int32), no reply expected
+#
+# POSITION is a request that always gets a full CHUNK back. STREAM only tells the
+# server where the player is: the server remembers the window it last sent and
+# streams a DELTA with the newly exposed strips, a full CHUNK if the windows do
+# not overlap, or nothing at all if the window has not changed. Clients that
+# only request tiles report the cell their player is in with CELL instead, so
+# the server knows where players are when it picks spawn points.
+FRAME_HEADER = struct.Struct("<HHI")
+POSITION = struct.Struct("<ii")
+CHUNK_HEADER = struct.Struct("<iiHH")
+STRIP_COUNT = struct.Struct("<H")
+STRIP_HEADER = struct.Struct("<HHHH")
+
+# Message types
+MSG_SPAWN = 1
+MSG_POSITION = 2
+MSG_CHUNK = 3
+MSG_STREAM = 4
+MSG_DELTA = 5
+MSG_TILE_REQUEST = 6
+MSG_TILE = 7
+MSG_CELL = 8
+
+# Side length, in cells, of the fixed world tiles clients cache
+TILE_SIZE = 32
+
+# Largest payload a peer will accept, so a corrupt header cannot exhaust memory
+MAX_PAYLOAD = 16 * 1024 * 1024
+
+
+# Function to read exactly size bytes; returns None if the peer closed first
+def recv_exact(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if count == 0:
+            if received:
+                raise ConnectionError("connection closed in the middle of a frame")
+            return None
+        received += count
+    return view
+
+
+# Function to receive one frame; returns (message type, payload) or None on close
+def recv_frame(sock):
+    header = recv_exact(sock, FRAME_HEADER.size)
+    if header is None:
+        return None
+    msg_type, _, length = FRAME_HEADER.unpack(header)
+    if length > MAX_PAYLOAD:
+        raise ValueError(f"frame payload of {length} bytes exceeds {MAX_PAYLOAD}")
+    payload = recv_exact(sock, length) if length else memoryview(b"")
+    if payload is None:
+        raise ConnectionError("connection closed in the middle of a frame")
+    return msg_type, payload
+
+
+# Function to receive a frame and check that it is of the expected type
+def recv_message(sock, expected_type):
+    frame = recv_frame(sock)
+    if frame is None:
+        return None
+    msg_type, payload = frame
+    if msg_type != expected_type:
+        raise ValueError(f"expected message type {expected_type}, got {msg_type}")
+    return payload
+
+
+# Function to pull the first complete frame out of a receive buffer (for
+# event-loop servers that read whatever has arrived); returns (message type,
+# payload, frame size) or None while the frame is still in flight
+def parse_frame(buffer):
+    if len(buffer) < FRAME_HEADER.size:
+        return None
+    msg_type, _, length = FRAME_HEADER.unpack_from(buffer)
+    if length > MAX_PAYLOAD:
+        raise ValueError(f"frame payload of {length} bytes exceeds {MAX_PAYLOAD}")
+    size = FRAME_HEADER.size + length
+    if len(buffer) < size:
+        return None
+    return msg_type, bytes(buffer[FRAME_HEADER.size : size]), size
+
+
+# Function to build one frame from several buffers without joining them; returns
+# the list of buffers to write, header first
+def encode_frame(msg_type, *buffers):
+    views = [memoryview(buffer) for buffer in buffers]
+    views = [view if view.format == "B" else view.cast("B") for view in views]
+    length = sum(view.nbytes for view in views)
+    views.insert(0, memoryview(FRAME_HEADER.pack(msg_type, 0, length)))
+    return views
+
+
+# Function to write a list of buffers (one or more frames) with vectored sends
+def send_buffers(sock, buffers):
+    views = [memoryview(buffer) for buffer in buffers]
+
+    # sendmsg may write only part of the vector; drop what was sent and retry
+    while views:
+        sent = sock.sendmsg(views)
+        while views and sent >= views[0].nbytes:
+            sent -= views[0].nbytes
+            views.pop(0)
+        if views and sent:
+            views[0] = views[0][sent:]
+
+
+# Function to send one frame made of several buffers without joining them first
+def send_frame(sock, msg_type, *buffers):
+    send_buffers(sock, encode_frame(msg_type, *buffers))
+
+
+# Function to encode a cell position (spawn point or player position)
+def encode_position(msg_type, x, y):
+    return encode_frame(msg_type, POSITION.pack(x, y))
+
+
+# Function to send a cell position (spawn point or player position)
+def send_position(sock, msg_type, x, y):
+    send_buffers(sock, encode_position(msg_type, x, y))
+
+
+# Function to decode a cell position payload
+def decode_position(payload):
+    return POSITION.unpack(payload)
+
+
+# Function to encode a maze chunk (or tile) together with its world origin and shape
+def encode_chunk(origin_x, origin_y, chunk, msg_type=MSG_CHUNK):
+    cells = np.ascontiguousarray(chunk, dtype=np.uint8)
+    height, width = cells.shape
+    return encode_frame(
+        msg_type,
+        CHUNK_HEADER.pack(origin_x, origin_y, height, width),
+        cells.reshape(-1),
+    )
+
+
+# Function to send a maze chunk (or tile) together with its world origin and shape
+def send_chunk(sock, origin_x, origin_y, chunk, msg_type=MSG_CHUNK):
+    send_buffers(sock, encode_chunk(origin_x, origin_y, chunk, msg_type))
+
+
+# Function to decode a chunk payload into (origin_x, origin_y, cells) without copying
+def decode_chunk(payload):
+    origin_x, origin_y, height, width = CHUNK_HEADER.unpack_from(payload)
+    cells = np.frombuffer(
+        payload, dtype=np.uint8, count=height * width, offset=CHUNK_HEADER.size
+    ).reshape(height, width)
+    return origin_x, origin_y, cells
+
+
+# Function to split the part of the new window not covered by the old one into
+# rectangles; windows are (min_x, min_y, max_x, max_y). Returns None if they do
+# not overlap at all
+def window_difference(old, new):
+    min_x, min_y = max(old[0], new[0]), max(old[1], new[1])
+    max_x, max_y = min(old[2], new[2]), min(old[3], new[3])
+    if min_x >= max_x or min_y >= max_y:
+        return None
+
+    rects = []
+    if new[1] < min_y:  # rows exposed above
+        rects.append((new[0], new[1], new[2], min_y))
+    if max_y < new[3]:  # rows exposed below
+        rects.append((new[0], max_y, new[2], new[3]))
+    if new[0] < min_x:  # columns exposed on the left
+        rects.append((new[0], min_y, min_x, max_y))
+    if max_x < new[2]:  # columns exposed on the right
+        rects.append((max_x, min_y, new[2], max_y))
+    return rects
+
+
+# Function to encode what brings a client from its old window to the new one
+# with as little data as possible; old is None if the client has no window yet.
+# Returns no buffers at all if the window has not changed
+def encode_window_update(maze, old, new):
+    if old == new:
+        return []
+    min_x, min_y, max_x, max_y = new
+    rects = None if old is None else window_difference(old, new)
+    if rects is None:
+        return encode_chunk(min_x, min_y, maze[min_y:max_y, min_x:max_x])
+
+    buffers = [
+        CHUNK_HEADER.pack(min_x, min_y, max_y - min_y, max_x - min_x),
+        STRIP_COUNT.pack(len(rects)),
+    ]
+    for x0, y0, x1, y1 in rects:
+        buffers.append(STRIP_HEADER.pack(x0 - min_x, y0 - min_y, y1 - y0, x1 - x0))
+        buffers.append(np.ascontiguousarray(maze[y0:y1, x0:x1]).reshape(-1))
+    return encode_frame(MSG_DELTA, *buffers)
+
+
+# Function to apply a delta payload to the client's current window; returns the
+# new (origin_x, origin_y, cells)
+def apply_delta(origin_x, origin_y, cells, payload):
+    new_x, new_y, height, width = CHUNK_HEADER.unpack_from(payload)
+    new_cells = np.empty((height, width), dtype=np.uint8)
+
+    # Carry over the part of the old window that is still visible
+    min_x, min_y = max(origin_x, new_x), max(origin_y, new_y)
+    max_x = min(origin_x + cells.shape[1], new_x + width)
+    max_y = min(origin_y + cells.shape[0], new_y + height)
+    if min_x < max_x and min_y < max_y:
+        new_cells[min_y - new_y : max_y - new_y, min_x - new_x : max_x - new_x] = cells[
+            min_y - origin_y : max_y - origin_y, min_x - origin_x : max_x - origin_x
+        ]
+
+    # Fill in the newly exposed strips
+    offset = CHUNK_HEADER.size
+    (strip_count,) = STRIP_COUNT.unpack_from(payload, offset)
+    offset += STRIP_COUNT.size
+    for _ in range(strip_count):
+        x, y, strip_height, strip_width = STRIP_HEADER.unpack_from(payload, offset)
+        offset += STRIP_HEADER.size
+        size = strip_height * strip_width
+        new_cells[y : y + strip_height, x : x + strip_width] = np.frombuffer(
+            payload, dtype=np.uint8, count=size, offset=offset
+        ).reshape(strip_height, strip_width)
+        offset += size
+    return new_x, new_y, new_cells
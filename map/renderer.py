@@ -0,0 +1,120 @@
+from collections import OrderedDict
+import math
+import numpy as np
+import pygame
+from worldgen import (
+    HORIZONTAL_WALL,
+    VERTICAL_WALL,
+    SLASH_FORWARD_WALL,
+    SLASH_BACKWARD_WALL,
+)
+
+# Line of each wall state inside its cell, as ((x0, y0), (x1, y1)) in cell units
+WALL_LINES = {
+    HORIZONTAL_WALL: ((0, 0), (1, 0)),
+    VERTICAL_WALL: ((0, 0), (0, 1)),
+    SLASH_FORWARD_WALL: ((0, 0), (1, 1)),
+    SLASH_BACKWARD_WALL: ((1, 0), (0, 1)),
+}
+
+# Pixels of margin around each tile surface so thick lines on the tile edge are
+# not cut off; the margin is transparent, so neighbouring tiles can overlap
+TILE_MARGIN = 2
+
+
+# Draws the world from cached tile surfaces: each tile of the tile cache is
+# rasterized once into its own surface, and a frame is just a few blits at the
+# player's offset. A surface is redrawn only when the tile cache holds new cells
+# for its tile, and surfaces are evicted least-recently-used over max_surfaces
+class TileRenderer:
+    def __init__(
+        self,
+        tile_cache,
+        cell_size,
+        wall_color,
+        background,
+        line_width=2,
+        max_surfaces=64,
+    ):
+        self.tile_cache = tile_cache
+        self.cell_size = cell_size
+        self.wall_color = wall_color
+        self.background = background
+        self.line_width = line_width
+        self.max_surfaces = max_surfaces
+        self.surfaces = OrderedDict()  # tile -> (cells the surface was drawn from, surface)
+
+    # Rasterize the walls of one tile into a new surface
+    def rasterize(self, cells):
+        size = self.cell_size
+        height, width = cells.shape
+        surface = pygame.Surface(
+            (width * size + 2 * TILE_MARGIN, height * size + 2 * TILE_MARGIN)
+        )
+        surface.fill(self.background)
+        for y, x in zip(*np.nonzero(cells)):
+            (x0, y0), (x1, y1) = WALL_LINES[cells[y, x]]
+            pygame.draw.line(
+                surface,
+                self.wall_color,
+                (TILE_MARGIN + (x + x0) * size, TILE_MARGIN + (y + y0) * size),
+                (TILE_MARGIN + (x + x1) * size, TILE_MARGIN + (y + y1) * size),
+                self.line_width,
+            )
+        surface.set_colorkey(self.background)
+        return surface.convert() if pygame.display.get_surface() else surface
+
+    # Get the surface of a tile, drawing it if the tile's cells changed; None if
+    # the tile is not cached (or is empty)
+    def surface(self, tile):
+        cells = self.tile_cache.get(tile)
+        if cells is None or cells.size == 0:
+            return None
+        cached = self.surfaces.get(tile)
+        if cached is not None and cached[0] is cells:
+            self.surfaces.move_to_end(tile)
+            return cached[1]
+
+        surface = self.rasterize(cells)
+        self.surfaces[tile] = (cells, surface)
+        self.surfaces.move_to_end(tile)
+        while len(self.surfaces) > self.max_surfaces:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    # World cells visible on the target surface with (center_x, center_y) at its
+    # center, as (min_x, min_y, max_x, max_y)
+    def visible_bounds(self, target, center_x, center_y):
+        half_width = target.get_width() / 2 / self.cell_size
+        half_height = target.get_height() / 2 / self.cell_size
+        return (
+            math.floor(center_x - half_width),
+            math.floor(center_y - half_height),
+            math.ceil(center_x + half_width),
+            math.ceil(center_y + half_height),
+        )
+
+    # Draw the world around (center_x, center_y), in world cells, onto target
+    def draw(self, target, center_x, center_y):
+        target.fill(self.background)
+        size = self.cell_size
+        tile_size = self.tile_cache.tile_size
+        screen_x = target.get_width() / 2 - center_x * size
+        screen_y = target.get_height() / 2 - center_y * size
+        bounds = self.visible_bounds(target, center_x, center_y)
+        for tile_x, tile_y in self.tile_cache.tiles_covering(*bounds):
+            surface = self.surface((tile_x, tile_y))
+            if surface is not None:
+                target.blit(
+                    surface,
+                    (
+                        round(screen_x + tile_x * tile_size * size) - TILE_MARGIN,
+                        round(screen_y + tile_y * tile_size * size) - TILE_MARGIN,
+                    ),
+                )
+
+
+# Draw the frame rate and the time spent producing the last frame
+def draw_frame_stats(target, font, clock, frame_time, color=(255, 0, 0)):
+    text = f"{clock.get_fps():5.1f} FPS  {frame_time * 1000:5.2f} ms/frame"
+    target.blit(font.render(text, True, color), (8, 8))
@@ -1,155 +1,369 @@
 import socket
 import threading
-import pickle
-import numpy as np
-from scipy.ndimage import label
-from noise import pnoise2
+import asyncio
+import argparse
+import multiprocessing
 import random
+import itertools
+import os
+import signal
+import time
+from worldgen import generate_perlin_noise_map, generate_regions, generate_walls
+from worldfile import save_world, load_world
+from connectivity import connect_maze
+from chunkedworld import ChunkedWorld
+from spawning import SpawnIndex
+from pathfinding import PathFinder, PathCache
+from hierarchical import HierarchicalPathFinder
+from metrics import Metrics, SamplingProfiler, write_snapshot
+from protocol import (
+    MSG_SPAWN,
+    MSG_POSITION,
+    MSG_STREAM,
+    MSG_TILE_REQUEST,
+    MSG_TILE,
+    MSG_CELL,
+    TILE_SIZE,
+    recv_frame,
+    parse_frame,
+    send_buffers,
+    encode_position,
+    decode_position,
+    encode_chunk,
+    encode_window_update,
+)
+
+# Address the server listens on
+HOST, PORT = "localhost", 5555
+
+# Event-loop engine: pending connection backlog, and the per-connection write
+# buffer size above which the server stops reading that client's requests
+BACKLOG = 1024
+WRITE_BUFFER_HIGH = 256 * 1024
+WRITE_BUFFER_LOW = 64 * 1024
 
-# Define the states for each cell
-NO_WALL = 0
-HORIZONTAL_WALL = 1
-VERTICAL_WALL = 2
-SLASH_FORWARD_WALL = 3
-SLASH_BACKWARD_WALL = 4
+# Rows (min_y, max_y) this process spawns players in; None spawns anywhere. Set
+# per worker when players are sharded by world region
+spawn_rows = None
+
+# Players spawn at least this many cells away from other players, spread over
+# the region types
+SPAWN_SPACING = 8
+SPAWN_BALANCE = True
 
 # Maze dimensions
 width, height = 1000, 1000
 
-# Define region types
-NORMAL = 0
-DENSE = 1
-WIDE = 2
-LONG = 3
-OPEN = 4
-EXTRA_WIDE = 5
-
-# Parameters for Perlin noise
-octaves = 5
-scale = 10.0
-persistence = 0.5
-lacunarity = 2.0
-
-# Generate Perlin noise map
-perlin_noise_map = np.zeros((height, width))
-for y in range(height):
-    for x in range(width):
-        perlin_noise_map[y][x] = pnoise2(
-            x / scale,
-            y / scale,
-            octaves=octaves,
-            persistence=persistence,
-            lacunarity=lacunarity,
-            repeatx=width,
-            repeaty=height,
-            base=42,
-        )
+# Seed for world generation; the same seed always produces the same world
+seed = 42
 
-# Normalize Perlin noise to range between 0 and 1
-perlin_noise_map = (perlin_noise_map - perlin_noise_map.min()) / (
-    perlin_noise_map.max() - perlin_noise_map.min()
+# World file the maze is mapped from; generated once and reused on every restart
+world_file = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), f"world_{width}x{height}_{seed}.dat"
 )
 
-# Assign regions based on Perlin noise values
-noise_map = np.full((height, width), NORMAL)  # Default all to NORMAL
-
-# Label connected clusters in the Perlin noise map
-clusters, num_clusters = label(perlin_noise_map < 0.5)
-
-# Randomly assign a region type to each cluster
-for cluster_num in range(1, num_clusters + 1):
-    region_type = np.random.choice([DENSE, WIDE, LONG, OPEN, EXTRA_WIDE])
-    noise_map[clusters == cluster_num] = region_type
-
-
-# Function to generate walls based on the region type
-def generate_walls_for_region(region_type):
-    if region_type == NORMAL:
-        return np.random.choice(
-            [
-                NO_WALL,
-                HORIZONTAL_WALL,
-                VERTICAL_WALL,
-                SLASH_FORWARD_WALL,
-                SLASH_BACKWARD_WALL,
-            ],
-            p=[0.2, 0.2, 0.2, 0.2, 0.2],
-        )
-    elif region_type == DENSE:
-        return np.random.choice(
-            [HORIZONTAL_WALL, VERTICAL_WALL, SLASH_FORWARD_WALL, SLASH_BACKWARD_WALL],
-            p=[0.25, 0.25, 0.25, 0.25],
-        )
-    elif region_type == WIDE:
-        return np.random.choice(
-            [NO_WALL, HORIZONTAL_WALL, VERTICAL_WALL], p=[0.5, 0.25, 0.25]
-        )
-    elif region_type == LONG:
-        return np.random.choice([NO_WALL, HORIZONTAL_WALL], p=[0.1, 0.9])
-    elif region_type == OPEN:
-        return NO_WALL
-    elif region_type == EXTRA_WIDE:
-        return np.random.choice(
-            [NO_WALL, HORIZONTAL_WALL, VERTICAL_WALL], p=[0.7, 0.15, 0.15]
-        )
+# Instrumentation: counters and latency histograms per stage, recorded in
+# per-thread buffers, and an optional sampling profiler. SIGUSR1 writes a
+# snapshot of both to the stats file ({pid} is filled in) and SIGUSR2 starts or
+# stops the profiler
+metrics = Metrics()
+profiler = SamplingProfiler()
+stats_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server_stats_{pid}.json")
 
+# The world being served: the finite maze array mapped from the world file, or
+# with chunked, an unbounded ChunkedWorld generated around the players on demand
+maze = noise_map = clusters = None
+chunked = False
 
-# Generate the maze using the noise map to define wall types
-maze = np.zeros((height, width), dtype=int)
-for y in range(height):
-    for x in range(width):
-        maze[y, x] = generate_walls_for_region(noise_map[y, x])
+# Cells of the chunked world lie within this distance of the origin on each
+# axis, so every chunk and tile origin fits the int32 fields of the protocol
+CHUNKED_LIMIT = 2**30
 
 
-# Function to find a valid starting position in the maze (a cell with NO_WALL)
-def find_valid_start_position(maze):
-    height, width = maze.shape
-    while True:
-        x = random.randint(0, width - 1)
-        y = random.randint(0, height - 1)
-        if maze[y, x] == NO_WALL:  # Check if this is a walkable area
-            return (x, y)
+# Function to open the finite world from the world file, generating it first if needed
+def open_world():
+    global maze, noise_map, clusters, seed
+    try:
+        with metrics.phase("load_world"):
+            maze, noise_map, clusters, seed = load_world(world_file)
+    except (FileNotFoundError, ValueError):
+        # Missing or written by an older version: generate the world (timing each
+        # stage), join all of its walkable areas so every spawn can reach every
+        # other, and map it
+        with metrics.phase("generate_perlin_noise_map"):
+            perlin_noise_map = generate_perlin_noise_map(width, height, seed)
+        with metrics.phase("generate_regions"):
+            noise_map, clusters = generate_regions(perlin_noise_map, seed)
+        with metrics.phase("generate_walls"):
+            maze = generate_walls(noise_map, seed)
+        with metrics.phase("connect_maze"):
+            maze = connect_maze(maze)
+        with metrics.phase("save_world"):
+            save_world(world_file, maze, noise_map, clusters, seed)
+        with metrics.phase("load_world"):
+            maze, noise_map, clusters, seed = load_world(world_file)
 
 
-# Function to extract a section of the maze around the player
-def get_maze_chunk(maze, center_x, center_y, chunk_size=50):
+# Function to open the unbounded chunked world; nothing is generated up front.
+# Pathfinding needs the whole maze, so it only works with the finite world
+def open_chunked_world(max_blocks=256, spill_dir=None):
+    global maze, chunked
+    with metrics.phase("open_chunked_world"):
+        maze = ChunkedWorld(seed, max_blocks, spill_dir)
+    chunked = True
+
+
+# Function to print how long each startup phase took
+def report_startup():
+    phases = ", ".join(f"{name} {seconds:.3f} s" for name, seconds in metrics.phases.items())
+    print(f"Startup: {phases}")
+
+
+# Pathfinders over the maze, built on first use; queries share their search
+# buffers, so they take turns. Found paths are cached for repeated queries
+path_finder = None
+route_planner = None
+path_cache = PathCache(max_paths=4096)
+path_finder_lock = threading.Lock()
+
+
+# Function to find a path through the maze between two (x, y) cells; jump uses
+# Jump Point Search, much faster in open regions (straight moves only). Meant
+# for nearby cells: across the map a query takes hundreds of milliseconds, so
+# long routes go through find_route
+def find_path(start, goal, diagonal=False, jump=False):
+    global path_finder
+    jump = jump and not diagonal
+    with path_finder_lock:
+        if path_finder is None:
+            path_finder = PathFinder(maze)
+        path = path_cache.get(start, goal, path_finder.version, (diagonal, jump))
+        if path is not None:
+            metrics.count("path_cache_hits")
+            return path
+        started = time.perf_counter()
+        if jump:
+            path = path_finder.find_jump_path(start, goal)
+        else:
+            path = path_finder.find_path(start, goal, diagonal)
+        metrics.observe("find_path", time.perf_counter() - started)
+        metrics.count("path_cache_misses")
+        path_cache.put(start, goal, path_finder.version, path, (diagonal, jump))
+        return path
+
+
+# Function to get the distance field to one or more (x, y) target cells, for
+# moving many agents towards the same targets; recent fields are cached
+def find_distance_field(targets, diagonal=False):
+    global path_finder
+    with path_finder_lock:
+        if path_finder is None:
+            path_finder = PathFinder(maze)
+        started = time.perf_counter()
+        field = path_finder.distance_field(targets, diagonal)
+        metrics.observe("find_distance_field", time.perf_counter() - started)
+        return field
+
+
+# Function to find a long-range route between two (x, y) cells through the
+# precomputed cluster graph; faster than find_path across the map, at the price
+# of routes a few percent longer than the shortest
+def find_route(start, goal):
+    global path_finder, route_planner
+    with path_finder_lock:
+        if route_planner is None:
+            if path_finder is None:
+                path_finder = PathFinder(maze)
+            route_planner = HierarchicalPathFinder(maze, path_finder=path_finder)
+        path = path_cache.get(start, goal, path_finder.version, ("route",))
+        if path is not None:
+            metrics.count("path_cache_hits")
+            return path
+        started = time.perf_counter()
+        path = route_planner.find_path(start, goal)
+        metrics.observe("find_route", time.perf_counter() - started)
+        metrics.count("path_cache_misses")
+        path_cache.put(start, goal, path_finder.version, path, ("route",))
+        return path
+
+
+# Function to compute the bounds of the section of the maze around the player;
+# in the finite world they are clipped to it, so a center far outside the world
+# gets an empty section
+def get_chunk_bounds(center_x, center_y, chunk_size=50):
     half_chunk = chunk_size // 2
-    min_x = max(center_x - half_chunk, 0)
-    max_x = min(center_x + half_chunk, width)
-    min_y = max(center_y - half_chunk, 0)
-    max_y = min(center_y + half_chunk, height)
+    min_x, max_x = center_x - half_chunk, center_x + half_chunk
+    min_y, max_y = center_y - half_chunk, center_y + half_chunk
+    if chunked:
+        return min_x, min_y, max_x, max_y
+    min_x, min_y = min(max(min_x, 0), width), min(max(min_y, 0), height)
+    return min_x, min_y, min(max(max_x, min_x), width), min(max(max_y, min_y), height)
+
+
+# Function to reject coordinates of the chunked world whose chunks or tiles
+# would have origins beyond the int32 range of the wire format
+def check_coordinates(x, y):
+    if chunked and not (-CHUNKED_LIMIT <= x <= CHUNKED_LIMIT and -CHUNKED_LIMIT <= y <= CHUNKED_LIMIT):
+        raise ValueError(f"coordinates ({x}, {y}) are outside the world")
+
 
+# Function to extract a section of the maze around the player
+def get_maze_chunk(maze, center_x, center_y, chunk_size=50):
+    min_x, min_y, max_x, max_y = get_chunk_bounds(center_x, center_y, chunk_size)
     return maze[min_y:max_y, min_x:max_x]
 
 
+# Function to extract one fixed-size tile of the maze; in the finite world tiles
+# past the edge are clipped and tiles before it are empty
+def get_maze_tile(maze, tile_x, tile_y):
+    min_x, min_y = tile_x * TILE_SIZE, tile_y * TILE_SIZE
+    if not chunked and (min_x < 0 or min_y < 0):
+        return maze[0:0, 0:0]
+    return maze[min_y : min_y + TILE_SIZE, min_x : min_x + TILE_SIZE]
+
+
+# Function to answer one message from a client; returns the buffers to send
+# back, possibly none. session holds the state of the connection. Times the
+# extraction and the serialization of the reply separately
+def handle_message(session, msg_type, payload):
+    started = time.perf_counter()
+    if msg_type == MSG_TILE_REQUEST:
+        # Tiles are independent of the streamed window
+        tile_x, tile_y = decode_position(payload)
+        check_coordinates(tile_x * TILE_SIZE, tile_y * TILE_SIZE)
+        maze_tile = get_maze_tile(maze, tile_x, tile_y)
+        extracted = time.perf_counter()
+        buffers = encode_chunk(tile_x * TILE_SIZE, tile_y * TILE_SIZE, maze_tile, MSG_TILE)
+        finished = time.perf_counter()
+        metrics.count("requests_tile")
+        metrics.observe("get_maze_tile", extracted - started)
+        metrics.observe("encode_chunk", finished - extracted)
+        metrics.observe("handle_message", finished - started)
+        return buffers
+
+    center_x, center_y = decode_position(payload)
+    check_coordinates(center_x, center_y)
+    if spawn_index is not None:
+        with spawn_lock:
+            spawn_index.move(session["player"], (center_x, center_y))
+    if msg_type == MSG_CELL:
+        # Only tracks the player (clients that request tiles); nothing to send
+        metrics.count("requests_cell")
+        metrics.observe("handle_message", time.perf_counter() - started)
+        return []
+    bounds = get_chunk_bounds(center_x, center_y)
+
+    if msg_type == MSG_POSITION:
+        # Send the relevant chunk of the maze based on the player's current position
+        extract_started = time.perf_counter()
+        maze_chunk = get_maze_chunk(maze, center_x, center_y)
+        extracted = time.perf_counter()
+        buffers = encode_chunk(bounds[0], bounds[1], maze_chunk)
+        metrics.count("requests_position")
+        metrics.observe("get_maze_chunk", extracted - extract_started)
+        metrics.observe("encode_chunk", time.perf_counter() - extracted)
+    elif msg_type == MSG_STREAM:
+        # Only send what the client does not have yet (nothing if unchanged)
+        encode_started = time.perf_counter()
+        buffers = encode_window_update(maze, session["window"], bounds)
+        metrics.count("requests_stream")
+        metrics.observe("encode_window_update", time.perf_counter() - encode_started)
+    else:
+        raise ValueError(f"unexpected message type {msg_type}")
+    session["window"] = bounds
+    metrics.observe("handle_message", time.perf_counter() - started)
+    return buffers
+
+
+# Function to count the bytes of the buffers handed to a socket or transport
+def count_sent(buffers):
+    metrics.count("bytes_sent", sum(memoryview(buffer).nbytes for buffer in buffers))
+
+
+# Index of the spawn cells, built on first use (after the workers are forked, so
+# each one indexes its own rows), and the ids handed out to players
+spawn_index = None
+spawn_lock = threading.Lock()
+player_ids = itertools.count()
+
+
+# Function to pick a spawn point for a new player from the spawn index
+def spawn_player(player):
+    global spawn_index
+    started = time.perf_counter()
+    if chunked:
+        position = maze.find_spawn(random)
+        metrics.observe("spawn", time.perf_counter() - started)
+        return position
+    with spawn_lock:
+        if spawn_index is None:
+            with metrics.phase("build_spawn_index"):
+                spawn_index = SpawnIndex(
+                    maze, noise_map, rows=spawn_rows, largest_component=True, min_spacing=SPAWN_SPACING
+                )
+            started = time.perf_counter()
+        position = spawn_index.spawn(player, balance=SPAWN_BALANCE)
+    metrics.observe("spawn", time.perf_counter() - started)
+    if position is None:
+        raise ValueError("no walkable cell left to spawn in")
+    return position
+
+
+# Function to start a session: pick the player's spawn point and return the new
+# session state with the buffers announcing the spawn point
+def start_session():
+    # Window of the maze the client currently holds, as (min_x, min_y, max_x, max_y)
+    session = {"window": None, "player": next(player_ids)}
+    metrics.count("connections_opened")
+    player_position = spawn_player(session["player"])
+    return session, encode_position(MSG_SPAWN, *player_position)
+
+
+# Function to end a session: stop tracking the player's position
+def end_session(session):
+    metrics.count("connections_closed")
+    with spawn_lock:
+        if spawn_index is not None:
+            spawn_index.remove(session["player"])
+
+
 # Server to handle communication and send map chunks
 def handle_client(client_socket):
+    session = None
     try:
         # Send the player their initial valid spawn point
-        player_position = find_valid_start_position(maze)
-        client_socket.sendall(pickle.dumps(player_position))
+        session, buffers = start_session()
+        send_buffers(client_socket, buffers)
+        count_sent(buffers)
 
         while True:
             # Receive player's current position from client
-            data = client_socket.recv(1024)
-            if not data:
+            frame = recv_frame(client_socket)
+            if frame is None:
                 break
-            player_position = pickle.loads(data)
-
-            # Send the relevant chunk of the maze based on the player's current position
-            maze_chunk = get_maze_chunk(maze, player_position[0], player_position[1])
-            client_socket.sendall(pickle.dumps(maze_chunk))
+            buffers = handle_message(session, *frame)
+            started = time.perf_counter()
+            send_buffers(client_socket, buffers)
+            metrics.observe("send", time.perf_counter() - started)
+            count_sent(buffers)
     except Exception as e:
+        metrics.count("errors")
         print(f"Error: {e}")
     finally:
+        if session is not None:
+            end_session(session)
         client_socket.close()
+        # This thread ends with the connection
+        metrics.retire()
 
 
-# Server setup
-def server():
+# Server setup; with reuse_port several processes accept on the same port
+def server(reuse_port=False):
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    server_socket.bind(("localhost", 5555))
+    if reuse_port:
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    server_socket.bind((HOST, PORT))
     server_socket.listen(5)
     print("Server started, waiting for connections...")
 
@@ -164,5 +378,226 @@ def server():
         server_socket.close()
 
 
+# Event-loop connection: frames are parsed from whatever has arrived and replies
+# are queued on the transport's write buffer. When a client stops reading and its
+# buffer passes WRITE_BUFFER_HIGH, its requests are left unread until it drains
+class MazeClientProtocol(asyncio.Protocol):
+    def connection_made(self, transport):
+        self.transport = transport
+        self.buffer = bytearray()
+        self.paused = False
+        transport.set_write_buffer_limits(WRITE_BUFFER_HIGH, WRITE_BUFFER_LOW)
+        print(f"Connection from {transport.get_extra_info('peername')}")
+
+        # Send the player their initial valid spawn point
+        self.session, buffers = start_session()
+        transport.writelines(buffers)
+        count_sent(buffers)
+
+    def connection_lost(self, exc):
+        end_session(self.session)
+
+    def data_received(self, data):
+        self.buffer += data
+        self.process_frames()
+
+    # Answer buffered requests until they run out or the write buffer fills up
+    def process_frames(self):
+        try:
+            while not self.paused:
+                frame = parse_frame(self.buffer)
+                if frame is None:
+                    break
+                msg_type, payload, size = frame
+                del self.buffer[:size]
+                buffers = handle_message(self.session, msg_type, payload)
+                self.transport.writelines(buffers)
+                count_sent(buffers)
+        except Exception as e:
+            metrics.count("errors")
+            print(f"Error: {e}")
+            self.transport.abort()
+
+    def pause_writing(self):
+        metrics.count("write_pauses")
+        self.paused = True
+        self.transport.pause_reading()
+
+    def resume_writing(self):
+        self.paused = False
+        self.transport.resume_reading()
+        self.process_frames()
+
+
+# Event-loop server setup: one process and thread serving every connection
+def event_loop_server(reuse_port=False):
+    async def serve():
+        loop = asyncio.get_running_loop()
+        event_server = await loop.create_server(
+            MazeClientProtocol,
+            HOST,
+            PORT,
+            reuse_address=True,
+            reuse_port=reuse_port,
+            backlog=BACKLOG,
+        )
+        print("Server started, waiting for connections...")
+        async with event_server:
+            await event_server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("Server is shutting down...")
+
+
+# Server engines selectable from the command line
+ENGINES = {"thread": server, "asyncio": event_loop_server}
+
+
+# Function to write a snapshot of the metrics, and of the profile if one was
+# taken, to this process's stats file (the SIGUSR1 handler)
+def dump_stats(*_):
+    snapshot = metrics.snapshot(profiler if profiler.samples else None)
+    counters = snapshot["counters"]
+    snapshot["connections_active"] = counters.get("connections_opened", 0) - counters.get(
+        "connections_closed", 0
+    )
+    path = stats_file.format(pid=os.getpid())
+    write_snapshot(path, snapshot)
+    print(f"Wrote stats snapshot to {path}")
+
+
+# Function to start or stop the sampling profiler (the SIGUSR2 handler)
+def toggle_profiler(*_):
+    print(f"Sampling profiler {'started' if profiler.toggle() else 'stopped'} in process {os.getpid()}")
+
+
+# Function to install the stats and profiler signal handlers of a serving process
+def install_signal_handlers():
+    signal.signal(signal.SIGUSR1, dump_stats)
+    signal.signal(signal.SIGUSR2, toggle_profiler)
+
+
+# Function run in each worker process: serve on the shared port, optionally only
+# spawning players in this worker's horizontal band of the world
+def worker_server(engine, index, workers, shard_spawns, profile=False):
+    global spawn_rows
+    if shard_spawns:
+        spawn_rows = (height * index // workers, height * (index + 1) // workers)
+    install_signal_handlers()
+    threading.Thread(target=watch_parent, args=(os.getppid(),), daemon=True).start()
+    if profile:
+        profiler.start()
+    ENGINES[engine](reuse_port=True)
+
+
+# Function run in a worker thread: stop the worker once its parent is gone (a
+# parent that is killed outright cannot stop its workers itself)
+def watch_parent(parent, interval=1.0):
+    while os.getppid() == parent:
+        time.sleep(interval)
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+# Multi-process server setup: every worker accepts on the same port through
+# SO_REUSEPORT and the kernel spreads connections between them. Workers are
+# forked after the world file is mapped, so they all share one page-cached copy
+# of the maze instead of holding their own
+def multi_process_server(engine, workers, shard_spawns=False, profile=False):
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(
+            target=worker_server, args=(engine, index, workers, shard_spawns, profile)
+        )
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    # The parent does not serve: pass the stats and profiler signals on to the workers
+    def forward(signum, _):
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signum)
+
+    # Stopping the parent stops the workers, so none is left holding the port
+    def stop(signum, _):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGUSR1, forward)
+    signal.signal(signal.SIGUSR2, forward)
+    signal.signal(signal.SIGTERM, stop)
+
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # Workers get the interrupt as well; give them a moment to shut down
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+
 if __name__ == "__main__":
-    server()
+    parser = argparse.ArgumentParser(description="Maze map server")
+    parser.add_argument(
+        "--engine",
+        choices=sorted(ENGINES),
+        default="thread",
+        help="thread per connection, or a single asyncio event loop",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of worker processes sharing the port and the mapped world",
+    )
+    parser.add_argument(
+        "--shard-spawns",
+        action="store_true",
+        help="with several workers, spawn each worker's players in its own band of rows",
+    )
+    parser.add_argument(
+        "--world",
+        choices=["file", "chunked"],
+        default="file",
+        help="finite world from the world file, or an unbounded world generated on demand",
+    )
+    parser.add_argument(
+        "--cache-blocks",
+        type=int,
+        default=256,
+        help="chunked world: generated blocks kept in memory",
+    )
+    parser.add_argument(
+        "--spill-dir",
+        help="chunked world: directory evicted blocks are written to and read back from",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="start the sampling profiler right away (SIGUSR2 toggles it at any time)",
+    )
+    parser.add_argument(
+        "--stats-file",
+        default=stats_file,
+        help="where SIGUSR1 writes a stats snapshot; {pid} is replaced by the process id",
+    )
+    args = parser.parse_args()
+    stats_file = args.stats_file
+    if args.world == "chunked":
+        open_chunked_world(args.cache_blocks, args.spill_dir)
+    else:
+        open_world()
+    report_startup()
+    if args.workers > 1:
+        multi_process_server(args.engine, args.workers, args.shard_spawns, args.profile)
+    else:
+        install_signal_handlers()
+        if args.profile:
+            profiler.start()
+        ENGINES[args.engine]()
@@ -0,0 +1,197 @@
+from array import array
+import random
+import numpy as np
+from worldgen import NO_WALL
+from connectivity import maze_components
+
+# Number of region types (see worldgen), each with its own list of spawn cells
+REGION_TYPES = 6
+
+
+# Index of the cells players can spawn in, built once from the maze: the NO_WALL
+# cells, optionally only those of the largest walkable component, kept in one
+# list per region type. Drawing a spawn is a random pick from a list, so it
+# takes the same time however crowded the maze is. Cells are removed by swapping
+# in the last cell of their list, so updating the maze costs only the cells that
+# changed.
+#
+# The index also tracks where players are, to keep new spawns at least
+# min_spacing cells away from them (through a grid of buckets min_spacing wide)
+# and to spread players over the region types
+class SpawnIndex:
+    def __init__(
+        self, maze, regions, rows=None, largest_component=False, min_spacing=0, seed=None
+    ):
+        self.height, self.width = np.shape(maze)
+        self.regions = np.asarray(regions).ravel()
+        self.rows = rows or (0, self.height)
+        self.largest_component = largest_component
+        self.min_spacing = min_spacing
+        self.rng = random.Random(seed)
+
+        self.cells = [array("q") for _ in range(REGION_TYPES)]  # spawn cells per region type
+        self.slot = np.full(self.height * self.width, -1, dtype=np.int64)  # cell -> list position
+        self.players = {}  # player -> (x, y)
+        self.buckets = {}  # (bucket_x, bucket_y) -> players in that bucket
+        self.region_players = [0] * REGION_TYPES
+        self.build(maze)
+
+    def __len__(self):
+        return sum(len(cells) for cells in self.cells)
+
+    # Cells of the maze that can be spawned in
+    def spawnable(self, maze):
+        maze = np.asarray(maze)
+        allowed = np.zeros(maze.shape, dtype=bool)
+        min_y, max_y = self.rows
+        allowed[min_y:max_y] = maze[min_y:max_y] == NO_WALL
+        if self.largest_component:
+            labels, _ = maze_components(maze)
+            sizes = np.bincount(labels[allowed])
+            sizes[0] = 0
+            allowed &= labels == np.argmax(sizes)
+        return allowed
+
+    # Index every spawnable cell of the maze from scratch
+    def build(self, maze):
+        self.slot[:] = -1
+        cells = np.flatnonzero(self.spawnable(maze))
+        regions = self.regions[cells]
+        for region in range(REGION_TYPES):
+            selected = cells[regions == region]
+            self.cells[region] = array("q", selected.astype(np.int64).tobytes())
+            self.slot[selected] = np.arange(len(selected))
+
+    def add(self, cell):
+        if self.slot[cell] == -1:
+            cells = self.cells[self.regions[cell]]
+            self.slot[cell] = len(cells)
+            cells.append(cell)
+
+    def discard(self, cell):
+        position = self.slot[cell]
+        if position == -1:
+            return
+        cells = self.cells[self.regions[cell]]
+        last = cells.pop()
+        if last != cell:
+            cells[position] = last
+            self.slot[last] = position
+        self.slot[cell] = -1
+
+    # Update the index after the maze changed inside a rectangle of cells. The
+    # largest component can change anywhere, so with that restriction the whole
+    # index is rebuilt
+    def update(self, maze, min_x, min_y, max_x, max_y):
+        if self.largest_component:
+            self.build(maze)
+            return
+        maze = np.asarray(maze)
+        low, high = max(min_y, self.rows[0]), min(max_y, self.rows[1])
+        if low >= high or min_x >= max_x:
+            return
+        ys, xs = np.mgrid[low:high, min_x:max_x]
+        cells = (ys * self.width + xs).ravel()
+        spawnable = (maze[low:high, min_x:max_x] == NO_WALL).ravel()
+        for cell in cells[spawnable & (self.slot[cells] == -1)].tolist():
+            self.add(cell)
+        for cell in cells[~spawnable & (self.slot[cells] != -1)].tolist():
+            self.discard(cell)
+
+    # Function to draw a random spawn cell, optionally of one region type; None if
+    # there is none
+    def draw(self, region=None):
+        if region is None:
+            total = len(self)
+            if total == 0:
+                return None
+            pick = self.rng.randrange(total)
+            for cells in self.cells:
+                if pick < len(cells):
+                    break
+                pick -= len(cells)
+        else:
+            cells = self.cells[region]
+            if not cells:
+                return None
+            pick = self.rng.randrange(len(cells))
+        cell = cells[pick]
+        return (cell % self.width, cell // self.width)
+
+    # Region types with spawn cells, fewest players first (ties in random order)
+    def regions_by_crowding(self):
+        candidates = [region for region in range(REGION_TYPES) if self.cells[region]]
+        self.rng.shuffle(candidates)
+        return sorted(candidates, key=self.region_players.__getitem__)
+
+    def bucket(self, position):
+        size = max(self.min_spacing, 1)
+        return (position[0] // size, position[1] // size)
+
+    # Whether a cell is at least min_spacing away from every tracked player
+    def spaced(self, position):
+        if self.min_spacing <= 0:
+            return True
+        x, y = position
+        bucket_x, bucket_y = self.bucket(position)
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                for player in self.buckets.get((bucket_x + dx, bucket_y + dy), ()):
+                    other_x, other_y = self.players[player]
+                    if max(abs(other_x - x), abs(other_y - y)) < self.min_spacing:
+                        return False
+        return True
+
+    # Function to pick a spawn cell for a new player and start tracking them.
+    # With balance the player goes to the region type with the fewest players
+    # that still has room. A few draws per region type are tried to keep
+    # min_spacing; if they all land near other players, the first one is used.
+    # Returns (x, y), or None if there is no spawn cell
+    def spawn(self, player, region=None, balance=False, attempts=16):
+        if region is not None:
+            candidates = [region]
+        elif balance:
+            candidates = self.regions_by_crowding()
+        else:
+            candidates = [None]
+        fallback = None
+        for candidate in candidates:
+            for _ in range(attempts):
+                position = self.draw(candidate)
+                if position is None:
+                    break
+                if self.spaced(position):
+                    self.move(player, position)
+                    return position
+                fallback = fallback or position
+        if fallback is not None:
+            self.move(player, fallback)
+        return fallback
+
+    # Function to track a player at a new (x, y) position
+    def move(self, player, position):
+        position = (int(position[0]), int(position[1]))
+        old = self.players.get(player)
+        if old == position:
+            return
+        if old is not None:
+            self.remove(player)
+        self.players[player] = position
+        self.buckets.setdefault(self.bucket(position), set()).add(player)
+        self.region_players[self.region_at(position)] += 1
+
+    # Function to stop tracking a player
+    def remove(self, player):
+        position = self.players.pop(player, None)
+        if position is None:
+            return
+        bucket = self.buckets[self.bucket(position)]
+        bucket.discard(player)
+        if not bucket:
+            del self.buckets[self.bucket(position)]
+        self.region_players[self.region_at(position)] -= 1
+
+    def region_at(self, position):
+        x = min(max(position[0], 0), self.width - 1)
+        y = min(max(position[1], 0), self.height - 1)
+        return int(self.regions[y * self.width + x])
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from scipy.ndimage import label
+from caves import random_fill, run_automaton
+from connectivity import connect_caves
+
+
+# C-shaped region: a ring with a gap in its right side, so the straight way
+# between its ends runs outside it
+def c_shape(size, thickness):
+    y, x = np.mgrid[:size, :size]
+    center = (size - 1) / 2
+    radius = np.hypot(y - center, x - center)
+    ring = (radius <= center) & (radius >= center - thickness)
+    return ring & ~((x > center) & (np.abs(y - center) < thickness))
+
+
+# Function to get a cave grown by the cellular automaton inside a region
+def region_cave(region, seed):
+    cells = random_fill(0, 0, *region.shape, seed)
+    return run_automaton(cells, region) & region
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_tunnels_stay_inside_allowed(seed):
+    region = c_shape(80, 12)
+    cave = region_cave(region, seed)
+    connected = connect_caves(cave, region)
+    assert not (connected & ~region).any()
+    assert (connected >= cave).all()
+    assert label(connected)[1] == 1
+
+
+def test_unconnectable_regions():
+    allowed = np.zeros((10, 10), dtype=bool)
+    allowed[:, :4] = allowed[:, 6:] = True
+    cave = np.zeros((10, 10), dtype=bool)
+    cave[5, 1] = cave[5, 8] = True
+    with pytest.raises(ValueError):
+        connect_caves(cave, allowed)
+
+
+def test_without_allowed():
+    cells = random_fill(0, 0, 100, 100, 5)
+    cave = run_automaton(cells, np.ones_like(cells))
+    connected = connect_caves(cave)
+    assert (connected >= cave).all()
+    assert label(connected)[1] == 1
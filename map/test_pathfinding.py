@@ -0,0 +1,101 @@
+import math
+import numpy as np
+import pytest
+from worldgen import (
+    NO_WALL,
+    HORIZONTAL_WALL,
+    VERTICAL_WALL,
+    SLASH_FORWARD_WALL,
+    SLASH_BACKWARD_WALL,
+    CELL_DTYPE,
+    generate_world,
+)
+from connectivity import connect_maze
+from pathfinding import PathFinder
+
+# Jump Point Search must find paths exactly as long as A*, and no path exactly
+# when A* finds none; the paths themselves may differ among equal-length ones
+
+
+# Function to check that a path is a chain of straight steps from start to goal
+def assert_straight_path(path, start, goal):
+    assert path[0] == start and path[-1] == goal
+    for (x, y), (next_x, next_y) in zip(path, path[1:]):
+        assert abs(next_x - x) + abs(next_y - y) == 1
+
+
+# Function to compare find_jump_path with find_path for every pair of cells given
+def assert_same_lengths(maze, pairs):
+    path_finder = PathFinder(maze)
+    for start, goal in pairs:
+        expected = path_finder.find_path(start, goal)
+        path = path_finder.find_jump_path(start, goal)
+        assert len(path) == len(expected), (start, goal, path, expected)
+        if path:
+            assert_straight_path(path, start, goal)
+
+
+def all_pairs(width, height):
+    cells = [(x, y) for y in range(height) for x in range(width)]
+    return [(start, goal) for start in cells for goal in cells]
+
+
+def test_open_grid():
+    maze = np.full((3, 3), NO_WALL, dtype=CELL_DTYPE)
+    assert len(PathFinder(maze).find_jump_path((0, 1), (1, 0))) == 3
+    assert_same_lengths(maze, all_pairs(3, 3))
+
+
+def test_open_grid_goal_on_row_zero():
+    maze = np.full((12, 9), NO_WALL, dtype=CELL_DTYPE)
+    pairs = [((x, y), (goal_x, 0)) for y in range(12) for x in range(9) for goal_x in range(9)]
+    assert_same_lengths(maze, pairs)
+
+
+def test_random_grids():
+    rng = np.random.default_rng(7)
+    walls = np.array(
+        [NO_WALL, HORIZONTAL_WALL, VERTICAL_WALL, SLASH_FORWARD_WALL, SLASH_BACKWARD_WALL],
+        dtype=CELL_DTYPE,
+    )
+    for _ in range(40):
+        maze = rng.choice(walls, size=(10, 10), p=[0.55, 0.15, 0.15, 0.075, 0.075])
+        cells = [(x, y) for y in range(10) for x in range(10)]
+        goals = [(x, 0) for x in range(10)] + [cells[i] for i in rng.choice(100, 10)]
+        starts = [cells[i] for i in rng.choice(100, 20)]
+        assert_same_lengths(maze, [(start, goal) for start in starts for goal in goals])
+
+
+def test_generated_maze():
+    maze, _, _ = generate_world(64, 64, 42)
+    rng = np.random.default_rng(42)
+    pairs = [
+        ((int(x0), int(y0)), (int(x1), int(y1)))
+        for x0, y0, x1, y1 in rng.integers(0, 64, size=(500, 4))
+    ]
+    pairs += [((int(x), int(y)), (int(goal_x), 0)) for x, y, goal_x in rng.integers(0, 64, size=(200, 3))]
+    assert_same_lengths(maze, pairs)
+
+
+# Function to get the cost of a path, with diagonal steps costing sqrt(2)
+def path_cost(path):
+    return sum(math.hypot(next_x - x, next_y - y) for (x, y), (next_x, next_y) in zip(path, path[1:]))
+
+
+# Following a distance field must cost exactly as much as the shortest path
+def test_distance_field_paths():
+    maze = connect_maze(generate_world(120, 120, 42)[0])
+    rng = np.random.default_rng(42)
+    open_cells = np.argwhere(maze == NO_WALL)
+    for diagonal in (False, True):
+        path_finder = PathFinder(maze)
+        for _ in range(5):
+            goal_y, goal_x = open_cells[rng.integers(len(open_cells))]
+            field = path_finder.distance_field([(goal_x, goal_y)], diagonal)
+            for start_y, start_x in open_cells[rng.integers(len(open_cells), size=20)]:
+                start, goal = (int(start_x), int(start_y)), (int(goal_x), int(goal_y))
+                expected = path_finder.find_path(start, goal, diagonal)
+                path = field.path(start)
+                assert path[0] == start and path[-1] == goal
+                assert path_cost(path) == pytest.approx(path_cost(expected), abs=1e-3)
+                assert path_cost(path) == pytest.approx(field.distance(start), abs=1e-3)
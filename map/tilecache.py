@@ -0,0 +1,89 @@
+from collections import OrderedDict
+import numpy as np
+
+
+# Client-side cache of fixed-size world tiles, keyed by (tile_x, tile_y), with
+# least-recently-used eviction once the cached cells exceed max_bytes
+class TileCache:
+    def __init__(self, tile_size, max_bytes):
+        self.tile_size = tile_size
+        self.max_bytes = max_bytes
+        self.tiles = OrderedDict()
+        self.pending = set()  # tiles requested but not received yet
+        self.nbytes = 0
+
+    def __contains__(self, tile):
+        return tile in self.tiles
+
+    # Get a cached tile and mark it as recently used; None if it is not cached
+    def get(self, tile):
+        cells = self.tiles.get(tile)
+        if cells is not None:
+            self.tiles.move_to_end(tile)
+        return cells
+
+    # Store a received tile, evicting the least recently used tiles over budget
+    def put(self, tile, cells):
+        self.pending.discard(tile)
+        old = self.tiles.pop(tile, None)
+        if old is not None:
+            self.nbytes -= old.nbytes
+        self.tiles[tile] = cells
+        self.nbytes += cells.nbytes
+        while self.nbytes > self.max_bytes and len(self.tiles) > 1:
+            _, evicted = self.tiles.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+    # Tiles overlapping a window of world cells given as (min_x, min_y, max_x, max_y)
+    def tiles_covering(self, min_x, min_y, max_x, max_y):
+        size = self.tile_size
+        return [
+            (tile_x, tile_y)
+            for tile_y in range(min_y // size, (max_y - 1) // size + 1)
+            for tile_x in range(min_x // size, (max_x - 1) // size + 1)
+        ]
+
+    # Tiles of a window that are neither cached nor already requested; the cached
+    # ones are marked as recently used so the tiles on their way do not evict them
+    def missing(self, min_x, min_y, max_x, max_y):
+        missing = []
+        for tile in self.tiles_covering(min_x, min_y, max_x, max_y):
+            if tile in self.tiles:
+                self.tiles.move_to_end(tile)
+            elif tile not in self.pending:
+                missing.append(tile)
+        return missing
+
+    # Whether every cell of a window lies in a cached tile; cells of tiles still on
+    # their way, and cells outside the world (tiles on the world edge are smaller
+    # or empty), are not covered
+    def covers(self, min_x, min_y, max_x, max_y):
+        size = self.tile_size
+        for tile_x, tile_y in self.tiles_covering(min_x, min_y, max_x, max_y):
+            tile = self.tiles.get((tile_x, tile_y))
+            if tile is None:
+                return False
+            x0, y0 = tile_x * size, tile_y * size
+            if min(max_x, x0 + size) > x0 + tile.shape[1] or min(max_y, y0 + size) > y0 + tile.shape[0]:
+                return False
+        return True
+
+    # Assemble a window of world cells from the cached tiles; cells that are not
+    # cached (or lie outside the world) are filled with fill
+    def window(self, min_x, min_y, max_x, max_y, fill=0):
+        size = self.tile_size
+        cells = np.full((max_y - min_y, max_x - min_x), fill, dtype=np.uint8)
+        for tile_x, tile_y in self.tiles_covering(min_x, min_y, max_x, max_y):
+            tile = self.get((tile_x, tile_y))
+            if tile is None:
+                continue
+            # Overlap between the tile (tiles on the world edge may be smaller) and the window
+            x0, y0 = tile_x * size, tile_y * size
+            left, top = max(x0, min_x), max(y0, min_y)
+            right = min(x0 + tile.shape[1], max_x)
+            bottom = min(y0 + tile.shape[0], max_y)
+            if left < right and top < bottom:
+                cells[top - min_y : bottom - min_y, left - min_x : right - min_x] = tile[
+                    top - y0 : bottom - y0, left - x0 : right - x0
+                ]
+        return cells
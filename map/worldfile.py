@@ -0,0 +1,76 @@
+import os
+import struct
+import numpy as np
+
+# On-disk world layout: a fixed-size header followed by the raw grids in GRIDS order
+#   magic (8s) | version (H) | grid count (H) | width (I) | height (I) | seed (q)
+#   then one 8-byte NumPy dtype string per grid, zero padded to HEADER_SIZE
+MAGIC = b"MAZEWRLD"
+# Bumped when the layout or the generated content changes, so old files are regenerated
+VERSION = 3
+HEADER_FORMAT = "<8sHHIIq"
+DTYPE_FORMAT = "8s"
+HEADER_SIZE = 64
+
+# Grids stored in a world file, in file order
+GRIDS = ("maze", "noise_map", "clusters")
+
+
+# Function to pack the header describing the world and the dtype of each grid
+def pack_header(width, height, seed, dtypes):
+    header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, len(dtypes), width, height, seed)
+    for dtype in dtypes:
+        header += struct.pack(DTYPE_FORMAT, np.dtype(dtype).str.encode("ascii"))
+    return header.ljust(HEADER_SIZE, b"\0")
+
+
+# Function to read and validate the header of a world file
+def read_header(path):
+    with open(path, "rb") as f:
+        header = f.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE:
+        raise ValueError(f"{path}: truncated world file header")
+
+    magic, version, grid_count, width, height, seed = struct.unpack_from(
+        HEADER_FORMAT, header
+    )
+    if magic != MAGIC:
+        raise ValueError(f"{path}: not a world file")
+    if version != VERSION:
+        raise ValueError(f"{path}: unsupported world file version {version}")
+
+    offset = struct.calcsize(HEADER_FORMAT)
+    dtypes = []
+    for _ in range(grid_count):
+        (dtype,) = struct.unpack_from(DTYPE_FORMAT, header, offset)
+        dtypes.append(np.dtype(dtype.rstrip(b"\0").decode("ascii")))
+        offset += struct.calcsize(DTYPE_FORMAT)
+    return width, height, seed, dtypes
+
+
+# Function to write a world to disk; the file is replaced atomically so other
+# server processes never map a half-written world
+def save_world(path, maze, noise_map, clusters, seed):
+    grids = (maze, noise_map, clusters)
+    height, width = maze.shape
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(pack_header(width, height, seed, [grid.dtype for grid in grids]))
+        for grid in grids:
+            np.ascontiguousarray(grid).tofile(f)
+    os.replace(tmp_path, path)
+
+
+# Function to map a world file read-only; grids are paged in on demand and the
+# page cache is shared between every process mapping the same file
+def load_world(path):
+    width, height, seed, dtypes = read_header(path)
+    grids = []
+    offset = HEADER_SIZE
+    for dtype in dtypes:
+        grids.append(
+            np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(height, width))
+        )
+        offset += dtype.itemsize * width * height
+    maze, noise_map, clusters = grids
+    return maze, noise_map, clusters, seed
@@ -0,0 +1,206 @@
+import numpy as np
+from scipy.ndimage import label
+
+# Define the states for each cell
+NO_WALL = 0
+HORIZONTAL_WALL = 1
+VERTICAL_WALL = 2
+SLASH_FORWARD_WALL = 3
+SLASH_BACKWARD_WALL = 4
+
+# Define region types
+NORMAL = 0
+DENSE = 1
+WIDE = 2
+LONG = 3
+OPEN = 4
+EXTRA_WIDE = 5
+
+# Wall states and region types both fit in one byte per cell
+CELL_DTYPE = np.uint8
+
+# Region types a labelled cluster can be turned into (everything else stays NORMAL)
+CLUSTER_REGION_TYPES = [DENSE, WIDE, LONG, OPEN, EXTRA_WIDE]
+
+# Probability of each wall state per region type, indexed [region_type][wall_state]
+WALL_PROBABILITIES = np.array(
+    [
+        [0.2, 0.2, 0.2, 0.2, 0.2],  # NORMAL
+        [0.0, 0.25, 0.25, 0.25, 0.25],  # DENSE
+        [0.5, 0.25, 0.25, 0.0, 0.0],  # WIDE
+        [0.1, 0.9, 0.0, 0.0, 0.0],  # LONG
+        [1.0, 0.0, 0.0, 0.0, 0.0],  # OPEN
+        [0.7, 0.15, 0.15, 0.0, 0.0],  # EXTRA_WIDE
+    ]
+)
+
+# Parameters for Perlin noise
+octaves = 5
+scale = 10.0
+persistence = 0.5
+lacunarity = 2.0
+
+# Cells are generated in square blocks, each with its own random stream, so the
+# result only depends on the seed and never on how the work is split up
+BLOCK_SIZE = 256
+
+# Independent random streams derived from the world seed
+STREAM_PERMUTATION = 0
+STREAM_REGIONS = 1
+STREAM_WALLS = 2
+STREAM_CAVES = 3
+STREAM_REGION_NOISE = 4
+
+# Gradient directions used by improved Perlin noise (same table as noise.pnoise2)
+GRAD_X = np.array([1, -1, 1, -1, 1, -1, 1, -1, 0, 0, 0, 0, 1, -1, 0, 0], np.float32)
+GRAD_Y = np.array([1, 1, -1, -1, 0, 0, 0, 0, 1, -1, 1, -1, 0, 0, -1, 1], np.float32)
+
+
+# Function to get the random generator for one stream of a seeded world
+def world_rng(seed, *key):
+    return np.random.default_rng([seed, *key])
+
+
+# Function to build the doubled permutation table for a seed
+def permutation_table(seed, stream=STREAM_PERMUTATION):
+    perm = world_rng(seed, stream).permutation(256)
+    return np.concatenate([perm, perm]).astype(np.intp)
+
+
+# Function to compute the gradient contribution of a hashed lattice corner
+def grad2(hash_, x, y):
+    h = hash_ & 15
+    return x * GRAD_X[h] + y * GRAD_Y[h]
+
+
+# Function to evaluate a single octave of tileable 2D Perlin noise on a grid
+def perlin_octave(xs, ys, repeatx, repeaty, perm):
+    # Lattice coordinates wrapped to the repeat period, per column and per row
+    i = np.floor(np.fmod(xs, repeatx)).astype(np.intp)
+    j = np.floor(np.fmod(ys, repeaty)).astype(np.intp)
+    ii = np.fmod(i + 1, repeatx).astype(np.intp) & 255
+    jj = np.fmod(j + 1, repeaty).astype(np.intp) & 255
+    i &= 255
+    j &= 255
+
+    # Position inside the lattice cell and the quintic fade curve
+    x = (xs - np.floor(xs)).astype(np.float32)
+    y = (ys - np.floor(ys)).astype(np.float32)
+    fx = x * x * x * (x * (x * 6 - 15) + 10)
+    fy = (y * y * y * (y * (y * 6 - 15) + 10))[:, np.newaxis]
+
+    # Hash the four corners, broadcasting rows (y) against columns (x)
+    a = perm[i]
+    b = perm[ii]
+    j = j[:, np.newaxis]
+    jj = jj[:, np.newaxis]
+    y = y[:, np.newaxis]
+
+    top = grad2(perm[a + j], x, y)
+    top += fx * (grad2(perm[b + j], x - 1, y) - top)
+    bottom = grad2(perm[a + jj], x, y - 1)
+    bottom += fx * (grad2(perm[b + jj], x - 1, y - 1) - bottom)
+    top += fy * (bottom - top)
+    return top
+
+
+# Function to generate raw fractal Perlin noise for a window of the world
+def perlin_noise(
+    x0,
+    y0,
+    width,
+    height,
+    seed,
+    repeatx,
+    repeaty,
+    octaves=octaves,
+    scale=scale,
+    persistence=persistence,
+    lacunarity=lacunarity,
+    stream=STREAM_PERMUTATION,
+):
+    perm = permutation_table(seed, stream)
+    xs = np.arange(x0, x0 + width, dtype=np.float64) / scale
+    ys = np.arange(y0, y0 + height, dtype=np.float64) / scale
+
+    total = np.zeros((height, width), dtype=np.float32)
+    freq = 1.0
+    amp = 1.0
+    max_amp = 0.0
+    for _ in range(octaves):
+        total += amp * perlin_octave(
+            xs * freq, ys * freq, repeatx * freq, repeaty * freq, perm
+        )
+        max_amp += amp
+        freq *= lacunarity
+        amp *= persistence
+    total /= max_amp
+    return total
+
+
+# Function to generate the Perlin noise map normalized to range between 0 and 1
+def generate_perlin_noise_map(width, height, seed):
+    perlin_noise_map = np.empty((height, width), dtype=np.float32)
+    for y0 in range(0, height, BLOCK_SIZE):
+        rows = min(BLOCK_SIZE, height - y0)
+        perlin_noise_map[y0 : y0 + rows] = perlin_noise(
+            0, y0, width, rows, seed, repeatx=width, repeaty=height
+        )
+
+    low, high = perlin_noise_map.min(), perlin_noise_map.max()
+    perlin_noise_map -= low
+    perlin_noise_map /= high - low
+    return perlin_noise_map
+
+
+# Function to assign a region type to every cell from the labelled noise clusters
+def generate_regions(perlin_noise_map, seed):
+    # Label connected clusters in the Perlin noise map
+    clusters, num_clusters = label(perlin_noise_map < 0.5)
+
+    # Randomly assign a region type to each cluster; label 0 (outside) stays NORMAL
+    region_types = (
+        world_rng(seed, STREAM_REGIONS)
+        .choice(CLUSTER_REGION_TYPES, size=num_clusters + 1)
+        .astype(CELL_DTYPE)
+    )
+    region_types[0] = NORMAL
+    noise_map = region_types[clusters]
+
+    # Store cluster labels in the smallest unsigned type that holds every label
+    return noise_map, clusters.astype(np.min_scalar_type(num_clusters))
+
+
+# Function to draw wall states for one block from the region type probabilities
+def generate_walls_for_block(regions, seed, block_y, block_x):
+    thresholds = np.cumsum(WALL_PROBABILITIES, axis=1).astype(np.float32)
+    draws = world_rng(seed, STREAM_WALLS, block_y, block_x).random(
+        regions.shape, dtype=np.float32
+    )
+
+    # Count how many cumulative thresholds each draw clears to pick the wall state
+    walls = np.zeros(regions.shape, dtype=CELL_DTYPE)
+    for state in range(SLASH_BACKWARD_WALL):
+        walls += draws >= thresholds[regions, state]
+    return walls
+
+
+# Function to generate the maze using the noise map to define wall types
+def generate_walls(noise_map, seed):
+    height, width = noise_map.shape
+    maze = np.zeros((height, width), dtype=CELL_DTYPE)
+    for y0 in range(0, height, BLOCK_SIZE):
+        for x0 in range(0, width, BLOCK_SIZE):
+            block = (slice(y0, y0 + BLOCK_SIZE), slice(x0, x0 + BLOCK_SIZE))
+            maze[block] = generate_walls_for_block(
+                noise_map[block], seed, y0 // BLOCK_SIZE, x0 // BLOCK_SIZE
+            )
+    return maze
+
+
+# Function to generate a complete world: wall grid, region grid and cluster labels
+def generate_world(width, height, seed):
+    perlin_noise_map = generate_perlin_noise_map(width, height, seed)
+    noise_map, clusters = generate_regions(perlin_noise_map, seed)
+    maze = generate_walls(noise_map, seed)
+    return maze, noise_map, clusters
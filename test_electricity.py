@@ -0,0 +1,45 @@
+import csv
+import SxGy_3_Uz_DType_MaxMinAvg_yr as electricity
+
+HEADER = "dwelling_type,year,month,Region,Location,kwh_per_acc\n"
+
+
+def write_csv(tmp_path, lines):
+    path = tmp_path / "electricity.csv"
+    path.write_bytes((HEADER + "".join(lines)).encode("utf-8"))
+    return str(path)
+
+
+# A stray quote must only cost its own line, not the lines after it
+def test_stray_quote(tmp_path):
+    lines = ['"B,2010,1,Central Region,Bishan,50.0\n']
+    lines += [f"A,2011,{month % 12 + 1},Central Region,Bishan,100.0\n" for month in range(5000)]
+    path = write_csv(tmp_path, lines)
+    for block_size in (64, electricity.BLOCK_SIZE):
+        groups, names, malformed = electricity.read_data(path, block_size)
+        stats = electricity.summarize(groups, names)
+        assert stats["A"][2011] == (100.0, 100.0, 500000.0, 5000)
+        assert malformed["count"] == 1
+        assert malformed["rows"][0][0] == 2
+
+
+# A quoted run longer than the csv field size limit is a malformed row too
+def test_field_over_limit(tmp_path):
+    long_field = '"' + "x" * (csv.field_size_limit() + 1)
+    lines = [f"{long_field},2010,1,Central Region,Bishan,50.0\n", "A,2011,1,Central Region,Bishan,100.0\n"]
+    groups, names, malformed = electricity.read_data(write_csv(tmp_path, lines))
+    stats = electricity.summarize(groups, names)
+    assert stats["A"][2011] == (100.0, 100.0, 100.0, 1)
+    assert malformed["count"] == 1
+
+
+def test_invalid_utf8(tmp_path):
+    path = tmp_path / "electricity.csv"
+    path.write_bytes(
+        HEADER.encode("utf-8")
+        + b"L\xe9,2010,1,Central Region,Bishan,50.0\n"
+        + b"A,2011,1,Central Region,Bishan,100.0\n"
+    )
+    groups, names, malformed = electricity.read_data(str(path))
+    assert electricity.summarize(groups, names) == {"A": {2011: (100.0, 100.0, 100.0, 1)}}
+    assert malformed["rows"] == [(2, "not valid UTF-8")]